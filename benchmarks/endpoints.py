@@ -0,0 +1,323 @@
+"""
+In-process benchmark of every route in src/app.py
+
+    python benchmarks/endpoints.py --characters 100000 --favorites 1000000 \\
+        --output bench.json [--baseline baseline.json --threshold 0.2]
+
+Seeds a local SQLite database (migrated with the real Alembic migrations, so
+indexes, FTS and generated columns are in place), drives each route through the
+Flask test client and reports throughput and p50/p95/p99 latency per endpoint
+as JSON. With --baseline, any endpoint whose p95 grew by more than --threshold
+is reported and the process exits with status 1.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="/tmp/benchmark.db", help="SQLite file to seed and benchmark against")
+    parser.add_argument("--reseed", action="store_true", help="drop and reseed the database even if it exists")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--characters", type=int, default=100000)
+    parser.add_argument("--planets", type=int, default=10000)
+    parser.add_argument("--vehicles", type=int, default=10000)
+    parser.add_argument("--favorites", type=int, default=1000000)
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed requests per endpoint")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of favorites per user (0 = uniform)")
+    parser.add_argument("--only", help="comma separated scenario names to run")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 growth over the baseline (0.2 = 20%%)")
+    return parser.parse_args()
+
+ARGS = parse_args()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.abspath(ARGS.db)
+# Freshly seeded rows would otherwise be held back from /changes for a few seconds.
+os.environ.setdefault("CHANGES_SETTLE_SECONDS", "0")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from flask_migrate import upgrade
+from app import app
+from seed import seed_database
+from events import broker
+
+def prepare_database(args):
+    if args.reseed and os.path.exists(args.db):
+        os.remove(args.db)
+    fresh = not os.path.exists(args.db)
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+        if fresh:
+            start = time.perf_counter()
+            counts = {key: getattr(args, key) for key in ("users", "characters", "planets", "vehicles", "favorites")}
+            seed_database(counts, seed=args.seed, skew=args.skew)
+            print("seeded %s in %.1fs" % (args.db, time.perf_counter() - start), file=sys.stderr)
+
+class Scenarios:
+    """One entry per route: name -> (endpoint, request factory). Factories return
+    (method, path, kwargs for the test client) and may vary between calls. A
+    factory can instead return a callable that makes the timed request(s) itself
+    and returns the status code, for routes that do not end with the response."""
+
+    def __init__(self, args, client):
+        self.args = args
+        self.client = client
+        self.rng = random.Random(args.seed)
+        self.counter = 0
+        self.token = None
+        self.changes_cursor = None
+        self.held_streams = []
+
+    def _next(self):
+        self.counter += 1
+        return "%d-%d" % (os.getpid(), self.counter)
+
+    def _id(self, count):
+        return self.rng.randint(1, count)
+
+    def _planet(self):
+        suffix = self._next()
+        return {"name": "Bench planet " + suffix, "url": "bench/planet/" + suffix, "climate": "arid",
+                "created": "2014-12-09T13:50:49Z", "diameter": "10465", "gravity": "1 standard", "orbital_period": 304,
+                "population": 200000, "rotation_period": 23, "surface_water": 1, "terrain": "desert",
+                "edited": "2014-12-20T20:58:18Z"}
+
+    def _vehicle(self):
+        suffix = self._next()
+        return {"name": "Bench vehicle " + suffix, "url": "bench/vehicle/" + suffix, "cargo_capacity": 50,
+                "created": "2014-12-10T15:36:25Z", "crew": 46, "length": "36.8", "manufacturer": "Corellia Mining Corporation",
+                "max_atmosphering_speed": 30, "model": "Digger Crawler", "vehicle_class": "wheeled",
+                "edited": "2014-12-20T21:30:21Z"}
+
+    def _character(self):
+        suffix = self._next()
+        return {"name": "Bench character " + suffix, "url": "bench/people/" + suffix, "height": 172, "mass": 77,
+                "hair_color": "blond", "skin_color": "fair", "eye_color": "blue", "birth_year": "19BBY", "gender": "male",
+                "homeworld": "https://swapi.dev/api/planets/1/", "created": "2014-12-09T13:50:51Z",
+                "edited": "2014-12-20T21:17:56Z"}
+
+    def _login_token(self):
+        if self.token is None:
+            response = self.client.post("/login", json={"email": "user1@example.com", "password": "secret1"})
+            self.token = response.get_json()["token"]
+        return self.token
+
+    def _changes_since(self):
+        # Cursor after the first page of the feed, so the scenario measures a resume.
+        if self.changes_cursor is None:
+            self.changes_cursor = self.client.get("/changes?limit=100").get_json()["next"]
+        return "GET", "/changes?limit=100&since=" + self.changes_cursor, {}
+
+    def _login(self):
+        user_id = self._id(self.args.users)
+        return "POST", "/login", {"json": {"email": "user%d@example.com" % user_id, "password": "secret%d" % user_id}}
+
+    def _favorite_pair(self, kind, count):
+        # Alternates add/remove of the same favorite so both paths stay warm.
+        user_id, target_id = self._id(self.args.users), self._id(count)
+        self.client.post("/favorite/%s/%d" % (kind, target_id), json={"user_id": user_id})
+        return "DELETE", "/favorite/%s/%d" % (kind, target_id), {"json": {"user_id": user_id}}
+
+    def _favorites_batch(self):
+        # Random adds and removes across the three target types for one user.
+        a = self.args
+        operations = [{"op": op, "type": kind, "id": self._id(count)}
+                      for kind, count in (("planet", a.planets), ("people", a.characters), ("vehicle", a.vehicles))
+                      for op in ("add", "add", "remove")]
+        return "POST", "/user/%d/favorites/batch" % self._id(a.users), {"json": operations}
+
+    def _stream_path(self):
+        return "/user/%d/favorites/stream" % self._id(self.args.users)
+
+    def _release_streams(self):
+        for stream in self.held_streams:
+            stream.close()
+        self.held_streams = []
+
+    def _stream_event(self):
+        # Time from a favorite write to its event on an already open stream.
+        self._release_streams()
+        user_id, planet_id = self._id(self.args.users), self._id(self.args.planets)
+        self.client.delete("/favorite/planet/%d" % planet_id, json={"user_id": user_id})
+        stream = self.client.get("/user/%d/favorites/stream" % user_id, buffered=False)
+        chunks = iter(stream.response)
+        next(chunks)  # retry: hint
+
+        def request():
+            try:
+                response = self.client.post("/favorite/planet/%d" % planet_id, json={"user_id": user_id})
+                if response.status_code >= 400:
+                    return response.status_code
+                for chunk in chunks:
+                    if b"event: favorite" in chunk:
+                        return stream.status_code
+                return 0
+            finally:
+                stream.close()
+        return request
+
+    def _stream_busy(self):
+        # Holds every stream slot of this process, so the request takes the 503 path.
+        # The slots are given back by the next _stream_event.
+        if not self.held_streams:
+            self.held_streams = [self.client.get(self._stream_path(), buffered=False)
+                                 for _ in range(broker.max_streams)]
+        return "GET", self._stream_path(), {}
+
+    def build(self):
+        a = self.args
+        return {
+            "sitemap": ("sitemap", lambda: ("GET", "/", {})),
+            "load_user": ("load_user", lambda: ("GET", "/user/%d" % self._id(a.users), {})),
+            "load_users": ("load_characters", lambda: ("GET", "/users", {})),
+            "load_people": ("load_character", lambda: ("GET", "/people", {})),
+            "load_people_page": ("load_character", lambda: ("GET", "/people?limit=100&after=%d" % self._id(a.characters), {})),
+            "load_people_fields": ("load_character", lambda: ("GET", "/people?fields=name,url&limit=1000", {})),
+            "load_people_filtered": ("load_character", lambda: ("GET", "/people?gender=female&min_height=170&sort=-mass", {})),
+            "load_people_ids": ("load_character", lambda: ("GET", "/people?ids=" + ",".join(
+                str(self._id(a.characters)) for _ in range(50)), {})),
+            "people_id": ("people_id", lambda: ("GET", "/people/%d" % self._id(a.characters), {})),
+            "load_planets": ("load_planet", lambda: ("GET", "/planets", {})),
+            "load_planets_filtered": ("load_planet", lambda: ("GET", "/planets?min_population=1000000&climate=arid", {})),
+            "planet_id": ("planet_id", lambda: ("GET", "/planet/%d" % self._id(a.planets), {})),
+            "load_vehicles": ("load_vehicle", lambda: ("GET", "/vehicles", {})),
+            "vehicle_id": ("vehicle_id", lambda: ("GET", "/vehicle/%d" % self._id(a.vehicles), {})),
+            "popular_people": ("popular_people", lambda: ("GET", "/people/popular", {})),
+            "popular_planets": ("popular_planets", lambda: ("GET", "/planets/popular", {})),
+            "popular_vehicles": ("popular_vehicles", lambda: ("GET", "/vehicles/popular", {})),
+            "batch": ("batch_requests", lambda: ("POST", "/batch", {"json": [
+                {"method": "GET", "path": "/user/%d" % self._id(a.users)},
+                {"method": "GET", "path": "/user/%d/favorites" % self._id(a.users)},
+                {"method": "GET", "path": "/planets"}] + [
+                {"method": "GET", "path": "/people/%d" % self._id(a.characters)} for _ in range(5)]})),
+            "load_changes": ("load_changes", lambda: ("GET", "/changes?limit=100", {})),
+            "load_changes_since": ("load_changes", lambda: self._changes_since()),
+            "search": ("search_catalog", lambda: ("GET", "/search?q=planet%%20%d" % self._id(a.planets), {})),
+            "cache_stats": ("cache_stats", lambda: ("GET", "/cache/stats", {})),
+            "pool_stats": ("load_pool_stats", lambda: ("GET", "/pool/stats", {})),
+            "metrics": ("metrics", lambda: ("GET", "/metrics", {})),
+            "load_user_favorites": ("load_user_favorites", lambda: ("GET", "/user/%d/favorites" % self._id(a.users), {})),
+            "load_user_favorites_expand": ("load_user_favorites", lambda: (
+                "GET", "/user/%d/favorites?expand=true" % self._id(a.users), {})),
+            "stream_user_favorites": ("stream_user_favorites", lambda: self._stream_event()),
+            "stream_user_favorites_busy": ("stream_user_favorites", lambda: self._stream_busy()),
+            "create_planet": ("create_planet", lambda: ("POST", "/planet", {"json": self._planet()})),
+            "create_vehicle": ("create_vehicle", lambda: ("POST", "/vehicle", {"json": self._vehicle()})),
+            "create_character": ("create_character", lambda: ("POST", "/people", {"json": self._character()})),
+            "bulk_create_planet": ("bulk_create_planet", lambda: ("POST", "/planet/bulk", {"json": [self._planet() for _ in range(100)]})),
+            "bulk_create_vehicle": ("bulk_create_vehicle", lambda: ("POST", "/vehicle/bulk", {"json": [self._vehicle() for _ in range(100)]})),
+            "bulk_create_character": ("bulk_create_character", lambda: ("POST", "/people/bulk", {"json": [self._character() for _ in range(100)]})),
+            "batch_user_favorites": ("batch_user_favorites", lambda: self._favorites_batch()),
+            "create_favorite_planet": ("create_favorite_planet", lambda: (
+                "POST", "/favorite/planet/%d" % self._id(a.planets), {"json": {"user_id": self._id(a.users)}})),
+            "create_favorite_character": ("create_favorite_character", lambda: (
+                "POST", "/favorite/people/%d" % self._id(a.characters), {"json": {"user_id": self._id(a.users)}})),
+            "create_favorite_vehicle": ("create_favorite_vehicle", lambda: (
+                "POST", "/favorite/vehicle/%d" % self._id(a.vehicles), {"json": {"user_id": self._id(a.users)}})),
+            "delete_favorite_planet": ("delete_favorite_planet", lambda: self._favorite_pair("planet", a.planets)),
+            "delete_favorite_people": ("delete_favorite_people", lambda: self._favorite_pair("people", a.characters)),
+            "delete_favorite_vehicle": ("delete_favorite_vehicle", lambda: self._favorite_pair("vehicle", a.vehicles)),
+            "create_user": ("create_user", lambda: ("POST", "/signup", {"json": {
+                "email": "bench%s@example.com" % self._next(), "password": "secret", "is_active": True}})),
+            "login_user": ("login_user", lambda: self._login()),
+            "protected": ("protected", lambda: ("GET", "/protected", {
+                "headers": {"Authorization": "Bearer " + self._login_token()}})),
+        }
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_scenario(client, factory, requests, warmup):
+    def prepare():
+        request = factory()
+        if callable(request):
+            return request
+        method, path, kwargs = request
+
+        def send():
+            response = client.open(path, method=method, **kwargs)
+            response.get_data()
+            return response.status_code
+        return send
+
+    for _ in range(warmup):
+        prepare()()
+    latencies = []
+    statuses = {}
+    started = time.perf_counter()
+    for _ in range(requests):
+        send = prepare()
+        start = time.perf_counter()
+        status_code = send()
+        latencies.append(time.perf_counter() - start)
+        statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "statuses": statuses,
+    }
+
+def compare(report, baseline, threshold):
+    regressions = []
+    for name, result in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous and previous["p95_ms"] > 0 and result["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append({"endpoint": name, "baseline_p95_ms": previous["p95_ms"], "p95_ms": result["p95_ms"],
+                                "change": round(result["p95_ms"] / previous["p95_ms"] - 1, 3)})
+    return regressions
+
+def main(args):
+    prepare_database(args)
+    client = app.test_client()
+    scenarios = Scenarios(args, client).build()
+
+    covered = {endpoint for endpoint, _ in scenarios.values()}
+    missing = sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                     if rule.endpoint not in covered and app.view_functions[rule.endpoint].__module__ in ("app", "metrics"))
+    if missing:
+        print("routes without a scenario: %s" % ", ".join(missing), file=sys.stderr)
+
+    selected = args.only.split(",") if args.only else list(scenarios)
+    report = {
+        "config": {key: getattr(args, key) for key in ("users", "characters", "planets", "vehicles", "favorites", "requests", "seed", "skew")},
+        "endpoints": {},
+    }
+    for name in selected:
+        endpoint, factory = scenarios[name]
+        report["endpoints"][name] = dict(run_scenario(client, factory, args.requests, args.warmup), endpoint=endpoint)
+        print("%-28s %9.1f req/s  p50 %8.2fms  p95 %8.2fms  p99 %8.2fms" % (
+            name, report["endpoints"][name]["throughput_rps"], report["endpoints"][name]["p50_ms"],
+            report["endpoints"][name]["p95_ms"], report["endpoints"][name]["p99_ms"]), file=sys.stderr)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as source:
+            report["regressions"] = compare(report, json.load(source), args.threshold)
+        if report["regressions"]:
+            status = 1
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as target:
+            target.write(output + "\n")
+    else:
+        print(output)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main(ARGS))
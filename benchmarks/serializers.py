@@ -0,0 +1,101 @@
+"""
+Micro-benchmark: per-row serialization + JSON encoding cost for Character and Planet
+
+    python benchmarks/serializers.py [--rows 10000] [--repeat 5]
+
+"before" is the hand-written serialize() the models used to have, encoded with
+Flask's default JSON provider; "after" is the compiled serializer on ORM objects
+and on plain row tuples, encoded with FastJSONProvider (orjson when installed).
+"""
+import os
+import sys
+import argparse
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from models import Character, Planet
+from serializers import FastJSONProvider, column_names, entity_serializer, row_serializer, orjson
+
+def legacy_character(self):
+    return {
+        "id": self.id,
+        "name": self.name,
+        "url": self.url,
+        "height": self.height,
+        "mass": self.mass,
+        "hair_color": self.hair_color,
+        "skin_color": self.skin_color,
+        "eye_color": self.eye_color,
+        "birth_year": self.birth_year,
+        "gender": self.gender,
+        "homeworld": self.homeworld,
+        "created": self.created,
+        "edited": self.edited
+    }
+
+def legacy_planet(self):
+    return {
+        "id": self.id,
+        "name": self.name,
+        "url": self.url,
+        "climate": self.climate,
+        "created": self.created,
+        "diameter": self.diameter,
+        "gravity": self.gravity,
+        "orbital_period": self.orbital_period,
+        "population": self.population,
+        "rotation_period": self.rotation_period,
+        "surface_water": self.surface_water,
+        "terrain": self.terrain,
+        "edited": self.edited
+    }
+
+def make_characters(n):
+    now = datetime(2014, 12, 9, 13, 50, 51, 644000)
+    return [Character(id=i, name="Character %d" % i, url="https://swapi.dev/api/people/%d/" % i, height=172, mass=77,
+                      hair_color="blond", skin_color="fair", eye_color="blue", birth_year="19BBY", gender="male",
+                      homeworld="https://swapi.dev/api/planets/1/", created=now, edited=now) for i in range(n)]
+
+def make_planets(n):
+    now = datetime(2014, 12, 9, 13, 50, 49, 641000)
+    return [Planet(id=i, name="Planet %d" % i, url="https://swapi.dev/api/planets/%d/" % i, climate="arid", created=now,
+                   diameter="10465", gravity="1 standard", orbital_period=304, population=200000, rotation_period=23,
+                   surface_water=1, terrain="desert", edited=now) for i in range(n)]
+
+def per_row_us(func, rows, repeat):
+    best = min(timeit.repeat(func, number=1, repeat=repeat))
+    return best / rows * 1e6
+
+def run(model, objects, legacy, repeat):
+    app = Flask(__name__)
+    default_json = DefaultJSONProvider(app)
+    fast_json = FastJSONProvider(app)
+    names = column_names(model)
+    tuples = [tuple(getattr(obj, name) for name in names) for obj in objects]
+    compiled = entity_serializer(model)
+    from_row = row_serializer(names)
+    n = len(objects)
+    return {
+        "before (serialize + default json)": per_row_us(lambda: default_json.dumps([legacy(o) for o in objects]), n, repeat),
+        "compiled on objects + fast json": per_row_us(lambda: fast_json.dumps_bytes([compiled(o) for o in objects]), n, repeat),
+        "compiled on row tuples + fast json": per_row_us(lambda: fast_json.dumps_bytes([from_row(r) for r in tuples]), n, repeat),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print("json backend: %s" % ("orjson" if orjson is not None else "stdlib"))
+    for model, objects, legacy in ((Character, make_characters(args.rows), legacy_character),
+                                   (Planet, make_planets(args.rows), legacy_planet)):
+        print("%s (%d rows)" % (model.__name__, args.rows))
+        for label, cost in run(model, objects, legacy, args.repeat).items():
+            print("  %-38s %7.2f us/row" % (label, cost))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# Loaded automatically by `gunicorn wsgi --chdir ./src/` (Procfile, render.yml)
+# since gunicorn reads ./gunicorn.conf.py from the directory it is started in.
+import os
+import shutil
+import tempfile
+
+# prometheus_client multiprocess mode: workers write their samples to files in this
+# directory and /metrics aggregates them. It has to be set before the app is imported.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "prometheus-multiproc"))
+
+
+def on_starting(server):
+    # Samples left over from a previous run would be added to the new totals.
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+# Threaded workers: an open /user/<id>/favorites/stream (SSE) connection holds one
+# thread for its whole lifetime (up to SSE_MAX_SECONDS), mostly idle waiting on its
+# queue. Threads come in two budgets, so streams never take the ones regular
+# requests need:
+#   GUNICORN_THREADS  threads for regular requests (default 8)
+#   SSE_MAX_STREAMS   open streams per worker (default 56); extra clients get 503
+# Each worker runs GUNICORN_THREADS + SSE_MAX_STREAMS threads, and the ceiling for
+# live clients is workers (WEB_CONCURRENCY) x SSE_MAX_STREAMS. Past a few hundred
+# streams per worker, threads stop being cheap: serve the stream route from an
+# async worker class (GUNICORN_WORKER_CLASS) instead.
+sse_max_streams = int(os.getenv("SSE_MAX_STREAMS", 56))
+# The app reads the same value when it is imported in the worker.
+os.environ["SSE_MAX_STREAMS"] = str(sse_max_streams)
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", 8)) + sse_max_streams
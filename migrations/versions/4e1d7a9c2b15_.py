@@ -0,0 +1,38 @@
+"""index edited columns
+
+Revision ID: 4e1d7a9c2b15
+Revises: cc9833456ce2
+Create Date: 2026-10-18 09:05:12.418230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e1d7a9c2b15'
+down_revision = 'cc9833456ce2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_character_edited'), ['edited'], unique=False)
+
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_planet_edited'), ['edited'], unique=False)
+
+    with op.batch_alter_table('vehicle', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_vehicle_edited'), ['edited'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('vehicle', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_vehicle_edited'))
+
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_planet_edited'))
+
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_character_edited'))
@@ -0,0 +1,43 @@
+"""favorites indexes and per-target uniqueness
+
+Revision ID: 8b3f0e6a71c4
+Revises: 4e1d7a9c2b15
+Create Date: 2026-10-18 10:41:37.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3f0e6a71c4'
+down_revision = '4e1d7a9c2b15'
+branch_labels = None
+depends_on = None
+
+TARGETS = (
+    ('planet_fk', 'uq_favorites_user_planet'),
+    ('vehicle_fk', 'uq_favorites_user_vehicle'),
+    ('character_fk', 'uq_favorites_user_character'),
+)
+
+
+def upgrade():
+    # Drop duplicates piled up by the old create endpoints, keeping the oldest row.
+    for column, _ in TARGETS:
+        op.execute(
+            "DELETE FROM favorites WHERE {0} IS NOT NULL AND id NOT IN ("
+            "SELECT MIN(id) FROM favorites WHERE {0} IS NOT NULL GROUP BY user_fk, {0})".format(column)
+        )
+
+    op.create_index('ix_favorites_user_fk', 'favorites', ['user_fk'], unique=False)
+    for column, name in TARGETS:
+        where = sa.text('{} IS NOT NULL'.format(column))
+        op.create_index(name, 'favorites', ['user_fk', column], unique=True,
+                        postgresql_where=where, sqlite_where=where)
+
+
+def downgrade():
+    for _, name in reversed(TARGETS):
+        op.drop_index(name, table_name='favorites')
+    op.drop_index('ix_favorites_user_fk', table_name='favorites')
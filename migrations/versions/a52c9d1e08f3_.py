@@ -0,0 +1,68 @@
+"""full-text search index
+
+Revision ID: a52c9d1e08f3
+Revises: 8b3f0e6a71c4
+Create Date: 2026-10-18 12:17:03.550871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a52c9d1e08f3'
+down_revision = '8b3f0e6a71c4'
+branch_labels = None
+depends_on = None
+
+# (table, kind code used in the SQLite rowid, name column, extra searchable columns)
+# Keep in sync with src/search.py
+SEARCHABLE = (
+    ('character', 1, 'name', ()),
+    ('planet', 2, 'name', ('climate', 'terrain')),
+    ('vehicle', 3, 'name', ('model', 'manufacturer')),
+)
+
+
+def _body(prefix, columns):
+    if not columns:
+        return "''"
+    return " || ' ' || ".join("coalesce({}{}, '')".format(prefix, column) for column in columns)
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # Generated tsvector columns stay in sync on every write, GIN keeps @@ an index scan.
+        for table, _, name, extra in SEARCHABLE:
+            vector = "setweight(to_tsvector('simple', coalesce({}, '')), 'A')".format(name)
+            if extra:
+                vector += " || setweight(to_tsvector('simple', {}), 'B')".format(_body('', extra))
+            op.execute('ALTER TABLE "{}" ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({}) STORED'.format(table, vector))
+            op.create_index('ix_{}_search_vector'.format(table), table, ['search_vector'], postgresql_using='gin')
+        return
+
+    # SQLite: one FTS5 table for all three models, rowid = id * 4 + kind code,
+    # maintained by triggers so bulk inserts and admin edits are covered too.
+    op.execute("CREATE VIRTUAL TABLE search_index USING fts5(name, body, tokenize='unicode61 remove_diacritics 2')")
+    for table, code, name, extra in SEARCHABLE:
+        insert_new = "INSERT INTO search_index(rowid, name, body) VALUES (new.id * 4 + {}, coalesce(new.{}, ''), {});".format(
+            code, name, _body('new.', extra))
+        delete_old = "DELETE FROM search_index WHERE rowid = old.id * 4 + {};".format(code)
+        op.execute('CREATE TRIGGER {0}_search_ai AFTER INSERT ON "{0}" BEGIN {1} END'.format(table, insert_new))
+        op.execute('CREATE TRIGGER {0}_search_au AFTER UPDATE ON "{0}" BEGIN {1} {2} END'.format(table, delete_old, insert_new))
+        op.execute('CREATE TRIGGER {0}_search_ad AFTER DELETE ON "{0}" BEGIN {1} END'.format(table, delete_old))
+        op.execute('INSERT INTO search_index(rowid, name, body) SELECT id * 4 + {}, coalesce({}, \'\'), {} FROM "{}"'.format(
+            code, name, _body('', extra), table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, _, _, _ in reversed(SEARCHABLE):
+            op.drop_index('ix_{}_search_vector'.format(table), table_name=table)
+            op.execute('ALTER TABLE "{}" DROP COLUMN search_vector'.format(table))
+        return
+
+    for table, _, _, _ in reversed(SEARCHABLE):
+        for suffix in ('ad', 'au', 'ai'):
+            op.execute('DROP TRIGGER IF EXISTS {}_search_{}'.format(table, suffix))
+    op.execute('DROP TABLE IF EXISTS search_index')
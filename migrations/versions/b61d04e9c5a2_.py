@@ -0,0 +1,58 @@
+"""tombstones for the change feed
+
+Revision ID: b61d04e9c5a2
+Revises: f3c81a5d27b9
+Create Date: 2026-10-18 18:06:40.284519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b61d04e9c5a2'
+down_revision = 'f3c81a5d27b9'
+branch_labels = None
+depends_on = None
+
+# Keep in sync with src/changes.py
+TABLES = ('character', 'planet', 'vehicle')
+
+
+def upgrade():
+    op.create_table('tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Triggers rather than application code, so Flask-Admin and raw SQL deletes are
+    # recorded as well. deleted_at is naive UTC, like the `edited` columns.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "CREATE FUNCTION record_tombstone() RETURNS trigger AS $$ BEGIN "
+            "INSERT INTO tombstones (kind, entity_id, deleted_at) VALUES (TG_TABLE_NAME, OLD.id, now() AT TIME ZONE 'utc'); "
+            "RETURN OLD; END $$ LANGUAGE plpgsql"
+        )
+        for table in TABLES:
+            op.execute('CREATE TRIGGER {0}_tombstone AFTER DELETE ON "{0}" '
+                       'FOR EACH ROW EXECUTE FUNCTION record_tombstone()'.format(table))
+        return
+    for table in TABLES:
+        # Same text format SQLAlchemy uses for DateTime on SQLite (microseconds, 6 digits).
+        op.execute(
+            'CREATE TRIGGER {0}_tombstone AFTER DELETE ON "{0}" BEGIN '
+            "INSERT INTO tombstones (kind, entity_id, deleted_at) "
+            "VALUES ('{0}', old.id, strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'); END".format(table)
+        )
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.execute('DROP TRIGGER IF EXISTS {0}_tombstone ON "{0}"'.format(table)
+                   if op.get_bind().dialect.name == 'postgresql' else
+                   'DROP TRIGGER IF EXISTS {}_tombstone'.format(table))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP FUNCTION IF EXISTS record_tombstone()')
+    op.drop_table('tombstones')
@@ -0,0 +1,69 @@
+"""per-table version counters for the list validators
+
+Revision ID: c48e2f1a9d37
+Revises: b61d04e9c5a2
+Create Date: 2026-10-19 09:12:27.604113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c48e2f1a9d37'
+down_revision = 'b61d04e9c5a2'
+branch_labels = None
+depends_on = None
+
+# Keep in sync with src/conditional.py
+TABLES = ('character', 'planet', 'vehicle')
+# Same text format SQLAlchemy uses for DateTime on SQLite (microseconds, 6 digits).
+SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'"
+
+
+def upgrade():
+    op.create_table('table_versions',
+    sa.Column('table_name', sa.String(length=30), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    dialect = op.get_bind().dialect.name
+    now = "now() AT TIME ZONE 'utc'" if dialect == 'postgresql' else SQLITE_NOW
+    for table in TABLES:
+        op.execute(
+            "INSERT INTO table_versions (table_name, version, changed_at) "
+            "SELECT '{0}', 1, coalesce(max(edited), {1}) FROM \"{0}\"".format(table, now)
+        )
+    # Triggers rather than application code, so bulk imports, Flask-Admin and raw SQL
+    # writes move the version as well. changed_at is naive UTC, like `edited`.
+    if dialect == 'postgresql':
+        op.execute(
+            "CREATE FUNCTION bump_table_version() RETURNS trigger AS $$ BEGIN "
+            "UPDATE table_versions SET version = version + 1, changed_at = now() AT TIME ZONE 'utc' "
+            "WHERE table_name = TG_TABLE_NAME; RETURN NULL; END $$ LANGUAGE plpgsql"
+        )
+        for table in TABLES:
+            op.execute('CREATE TRIGGER {0}_version AFTER INSERT OR UPDATE OR DELETE ON "{0}" '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()'.format(table))
+        return
+    # SQLite only has row-level triggers: one per statement type.
+    for table in TABLES:
+        for suffix, event in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE')):
+            op.execute(
+                'CREATE TRIGGER {0}_version_{1} AFTER {2} ON "{0}" BEGIN '
+                "UPDATE table_versions SET version = version + 1, changed_at = {3} "
+                "WHERE table_name = '{0}'; END".format(table, suffix, event, SQLITE_NOW)
+            )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in reversed(TABLES):
+            op.execute('DROP TRIGGER IF EXISTS {0}_version ON "{0}"'.format(table))
+        op.execute('DROP FUNCTION IF EXISTS bump_table_version()')
+    else:
+        for table in reversed(TABLES):
+            for suffix in ('ad', 'au', 'ai'):
+                op.execute('DROP TRIGGER IF EXISTS {}_version_{}'.format(table, suffix))
+    op.drop_table('table_versions')
@@ -0,0 +1,64 @@
+"""numeric generated columns and filter/sort indexes
+
+Revision ID: d7e24b6f93a0
+Revises: a52c9d1e08f3
+Create Date: 2026-10-18 14:02:48.117504
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e24b6f93a0'
+down_revision = 'a52c9d1e08f3'
+branch_labels = None
+depends_on = None
+
+# Leading number of the free-text column, NULL when there is none ("unknown", "N/A").
+# Mirrors models.numeric_prefix.
+NUMERIC_PREFIX = {
+    'sqlite': "CASE WHEN trim({0}) GLOB '[0-9]*' THEN CAST(replace(trim({0}), ',', '') AS REAL) END",
+    'postgresql': "CAST(replace(substring({0} from '^\\s*([0-9][0-9,]*(\\.[0-9]+)?)'), ',', '') AS double precision)",
+}
+
+GENERATED = (
+    ('planet', 'diameter_value', 'diameter'),
+    ('planet', 'gravity_value', 'gravity'),
+    ('vehicle', 'length_value', 'length'),
+)
+
+INDEXES = (
+    ('character', 'name'),
+    ('character', 'gender'),
+    ('character', 'height'),
+    ('character', 'mass'),
+    ('planet', 'climate'),
+    ('planet', 'population'),
+    ('planet', 'diameter_value'),
+    ('planet', 'gravity_value'),
+    ('vehicle', 'manufacturer'),
+    ('vehicle', 'vehicle_class'),
+    ('vehicle', 'length_value'),
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    expression = NUMERIC_PREFIX.get(dialect, 'CAST({0} AS FLOAT)')
+    # SQLite can only add VIRTUAL generated columns to an existing table; they can still be indexed.
+    persisted = dialect != 'sqlite'
+    for table, column, source in GENERATED:
+        op.add_column(table, sa.Column(column, sa.Float(), sa.Computed(sa.text(expression.format(source)), persisted=persisted), nullable=True))
+
+    for table, column in INDEXES:
+        op.create_index('ix_{}_{}'.format(table, column), table, [column], unique=False)
+
+
+def downgrade():
+    for table, column in reversed(INDEXES):
+        op.drop_index('ix_{}_{}'.format(table, column), table_name=table)
+
+    # Plain DROP COLUMN: a batch table copy would try to insert into the generated columns.
+    for table, column, _ in reversed(GENERATED):
+        op.drop_column(table, column)
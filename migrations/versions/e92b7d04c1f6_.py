@@ -0,0 +1,39 @@
+"""server-stamped changed_at for the change feed
+
+Revision ID: e92b7d04c1f6
+Revises: c48e2f1a9d37
+Create Date: 2026-10-19 10:41:05.318442
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e92b7d04c1f6'
+down_revision = 'c48e2f1a9d37'
+branch_labels = None
+depends_on = None
+
+# Keep in sync with src/changes.py
+TABLES = ('character', 'planet', 'vehicle')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        op.add_column(table, sa.Column('changed_at', sa.DateTime(), nullable=True))
+        # Existing rows keep their place in the feed: `edited` was its key until now.
+        op.execute('UPDATE "{}" SET changed_at = edited'.format(table))
+        # SQLite can only tighten the column by copying the table, which the generated
+        # columns and the search triggers rule out; the application always sets it.
+        if dialect != 'sqlite':
+            op.alter_column(table, 'changed_at', existing_type=sa.DateTime(), nullable=False)
+        op.create_index('ix_{}_changed_at'.format(table), table, ['changed_at'], unique=False)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_index('ix_{}_changed_at'.format(table), table_name=table)
+        # Plain DROP COLUMN: a batch table copy would try to insert into the generated columns.
+        op.drop_column(table, 'changed_at')
@@ -0,0 +1,43 @@
+"""favorite counters for the popularity leaderboards
+
+Revision ID: f3c81a5d27b9
+Revises: d7e24b6f93a0
+Create Date: 2026-10-18 17:48:12.530871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c81a5d27b9'
+down_revision = 'd7e24b6f93a0'
+branch_labels = None
+depends_on = None
+
+TARGETS = (
+    ('planet', 'planet_fk'),
+    ('vehicle', 'vehicle_fk'),
+    ('character', 'character_fk'),
+)
+
+
+def upgrade():
+    op.create_table('favorite_counts',
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'target_id')
+    )
+    op.create_index('ix_favorite_counts_kind_count', 'favorite_counts', ['kind', 'count', 'target_id'], unique=False)
+    # Start from the favorites that already exist.
+    for kind, column in TARGETS:
+        op.execute(
+            "INSERT INTO favorite_counts (kind, target_id, count) "
+            "SELECT '{0}', {1}, count(*) FROM favorites WHERE {1} IS NOT NULL GROUP BY {1}".format(kind, column)
+        )
+
+
+def downgrade():
+    op.drop_index('ix_favorite_counts_kind_count', table_name='favorite_counts')
+    op.drop_table('favorite_counts')
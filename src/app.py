@@ -4,17 +4,38 @@ This module takes care of starting the API Server, Loading the DB and Adding the
 import os
 from flask import Flask, request, jsonify, url_for, json
 from flask_migrate import Migrate
+from sqlalchemy.orm import joinedload
 from flask_swagger import swagger
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
+from utils import (APIException, generate_sitemap, keyset_paginate, parse_limit, parse_int_arg, parse_id_list,
+    parse_fields, select_fields, project, wants_stream, stream_collection)
 from admin import setup_admin
+from serializers import FastJSONProvider
 from models import db, User, Character, Planet, Vehicle, Favorites
+from conditional import list_validators, fields_validators, is_not_modified, with_validators, not_modified_response
+from cache import cached_detail, cached_details, detail_cache
+from bulk import bulk_request, parse_datetime
+from favorites import add_favorite, remove_favorite, apply_batch
+from popularity import popular
+from changes import changes_since
+from events import favorites_stream
+from batch import run_batch
+from commands import setup_commands
+from search import search, include_object
+from filters import apply_filters, apply_sort, paginate
+from pool import engine_options_from_env, pool_stats
+from replicas import setup_replicas
+from profiling import setup_profiling
+from metrics import setup_metrics
+from compression import setup_compression, cached_compressed
+from snapshot import list_response, detail_response
 from flask_jwt_extended import JWTManager
 from flask_jwt_extended import create_access_token
 from flask_jwt_extended import jwt_required, get_jwt_identity
 #from models import Person
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.url_map.strict_slashes = False
 app.config["JWT_SECRET_KEY"] = "super-secret" # ¡Cambia las palabras "super-secret" por otra cosa!
 jwt = JWTManager(app)
@@ -25,11 +46,17 @@ if db_url is not None:
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env()
+setup_replicas(app, app.config['SQLALCHEMY_ENGINE_OPTIONS'])
 
-MIGRATE = Migrate(app, db)
+MIGRATE = Migrate(app, db, include_object=include_object)
 db.init_app(app)
 CORS(app)
 setup_admin(app)
+setup_commands(app)
+setup_profiling(app)
+setup_metrics(app)
+setup_compression(app)
 
 # Handle/serialize errors like a JSON object
 @app.errorhandler(APIException)
@@ -43,11 +70,12 @@ def sitemap():
 
 @app.route('/user/<int:user_id>', methods=['GET'])
 def load_user(user_id):
-    user_query = User.query.filter_by(id = user_id).first()
+    query, serialize = select_fields(User, request.args)
+    user_query = query.filter(User.id == user_id).first()
     if user_query:
         response_body = {
             "msg": "Usuario encontrado",
-            "result": user_query.serialize()
+            "result": serialize(user_query)
         }
         return jsonify(response_body), 200
     else:
@@ -58,35 +86,70 @@ def load_user(user_id):
 
 @app.route('/users', methods=['GET'])
 def load_characters():
-    user_query = User.query.all()
-    load_user = [User.serialize() for User in user_query]
+    query, serialize = select_fields(User, request.args)
+    if wants_stream(request):
+        return stream_collection(query, User, request, serialize)
+    user_query, next_cursor = keyset_paginate(query, User, request.args)
+    load_user = [serialize(User) for User in user_query]
     response_body = {
         "msg": "Ok",
-        "result": load_user
+        "result": load_user,
+        "next": next_cursor
     }
 
     return jsonify(response_body), 200
 
 @app.route('/people', methods=['GET'])
 def load_character():
-    character_query = Character.query.all()
-    load_character = list(map(lambda item : item.serialize(), character_query))
+    if "ids" in request.args:
+        fields = parse_fields(Character, request.args)
+        result, not_found = cached_details(Character, parse_id_list(request.args))
+        response_body = {
+            "msg": "Ok",
+            "result": [project(item, fields) for item in result],
+            "not_found": not_found
+        }
+        return jsonify(response_body), 200
+    validators = list_validators(Character, request)
+    if is_not_modified(request, validators):
+        return not_modified_response(validators)
+    cached = cached_compressed(validators)
+    if cached is not None:
+        return cached
+    snapshot_page = list_response(Character, request, validators)
+    if snapshot_page is not None:
+        return snapshot_page
+    query, serialize = select_fields(Character, request.args)
+    if wants_stream(request):
+        query = apply_sort(apply_filters(query, Character, request.args), Character, request.args)
+        return with_validators(stream_collection(query, Character, request, serialize), validators)
+    character_query, next_cursor = paginate(query, Character, request.args)
+    load_character = list(map(serialize, character_query))
     response_body = {
         "msg": "Ok",
-        "result": load_character
+        "result": load_character,
+        "next": next_cursor
     }
 
-    return jsonify(response_body), 200
+    return with_validators(jsonify(response_body), validators), 200
 
 @app.route('/people/<int:people_id>', methods=['GET'])
 def people_id(people_id):
-    people_query = Character.query.filter_by(id = people_id ).first()
-    if people_query:
+    fields = parse_fields(Character, request.args)
+    snapshot_entry = detail_response(Character, people_id, request, "Character encontrado", "Character no existe!")
+    if snapshot_entry is not None:
+        return snapshot_entry
+    people_entry = cached_detail(Character, people_id)
+    if people_entry:
+        result, validators = people_entry
+        validators = fields_validators(validators, fields)
+        if is_not_modified(request, validators):
+            return not_modified_response(validators)
         response_body = {
             "msg": "Character encontrado",
-            "result": people_query.serialize()
+            "result": project(result, fields)
         }
-        return jsonify(response_body), 200
+        return with_validators(jsonify(response_body), validators), 200
     else:
         response_body = {
             "msg": "Character no existe!"
@@ -97,39 +160,112 @@ def people_id(people_id):
 
 @app.route('/planets', methods=['GET'])
 def load_planet():
-    planet_query = Planet.query.all()
-    planet = list(map(lambda item : item.serialize(), planet_query))
+    if "ids" in request.args:
+        fields = parse_fields(Planet, request.args)
+        result, not_found = cached_details(Planet, parse_id_list(request.args))
+        response_body = {
+            "msg": "Ok",
+            "result": [project(item, fields) for item in result],
+            "not_found": not_found
+        }
+        return jsonify(response_body), 200
+    validators = list_validators(Planet, request)
+    if is_not_modified(request, validators):
+        return not_modified_response(validators)
+    cached = cached_compressed(validators)
+    if cached is not None:
+        return cached
+    snapshot_page = list_response(Planet, request, validators)
+    if snapshot_page is not None:
+        return snapshot_page
+    query, serialize = select_fields(Planet, request.args)
+    if wants_stream(request):
+        query = apply_sort(apply_filters(query, Planet, request.args), Planet, request.args)
+        return with_validators(stream_collection(query, Planet, request, serialize), validators)
+    planet_query, next_cursor = paginate(query, Planet, request.args)
+    planet = list(map(serialize, planet_query))
     response_body = {
         "msg": "Ok",
-        "result": planet
+        "result": planet,
+        "next": next_cursor
     }
 
-    return jsonify(response_body), 200
+    return with_validators(jsonify(response_body), validators), 200
 
 @app.route('/planet/<int:planet_id>', methods=['GET'])
 def planet_id(planet_id):
-    planet_query = Planet.query.filter_by(id = planet_id ).first()
-    if planet_query:
+    fields = parse_fields(Planet, request.args)
+    snapshot_entry = detail_response(Planet, planet_id, request, "Planeta encontrado", "Planeta no existe!")
+    if snapshot_entry is not None:
+        return snapshot_entry
+    planet_entry = cached_detail(Planet, planet_id)
+    if planet_entry:
+        result, validators = planet_entry
+        validators = fields_validators(validators, fields)
+        if is_not_modified(request, validators):
+            return not_modified_response(validators)
         response_body = {
             "msg": "Planeta encontrado",
-            "result": planet_query.serialize()
+            "result": project(result, fields)
         }
-        return jsonify(response_body), 200
+        return with_validators(jsonify(response_body), validators), 200
     else:
         response_body = {
             "msg": "Planeta no existe!"
         }
         return jsonify(response_body), 404
 
+@app.route('/vehicles', methods=['GET'])
+def load_vehicle():
+    if "ids" in request.args:
+        fields = parse_fields(Vehicle, request.args)
+        result, not_found = cached_details(Vehicle, parse_id_list(request.args))
+        response_body = {
+            "msg": "Ok",
+            "result": [project(item, fields) for item in result],
+            "not_found": not_found
+        }
+        return jsonify(response_body), 200
+    validators = list_validators(Vehicle, request)
+    if is_not_modified(request, validators):
+        return not_modified_response(validators)
+    cached = cached_compressed(validators)
+    if cached is not None:
+        return cached
+    snapshot_page = list_response(Vehicle, request, validators)
+    if snapshot_page is not None:
+        return snapshot_page
+    query, serialize = select_fields(Vehicle, request.args)
+    if wants_stream(request):
+        query = apply_sort(apply_filters(query, Vehicle, request.args), Vehicle, request.args)
+        return with_validators(stream_collection(query, Vehicle, request, serialize), validators)
+    vehicle_query, next_cursor = paginate(query, Vehicle, request.args)
+    vehicle = list(map(serialize, vehicle_query))
+    response_body = {
+        "msg": "Ok",
+        "result": vehicle,
+        "next": next_cursor
+    }
+
+    return with_validators(jsonify(response_body), validators), 200
+
 @app.route('/vehicle/<int:vehicle_id>', methods=['GET'])
 def vehicle_id(vehicle_id):
-    vehicle_query = Vehicle.query.filter_by(id = vehicle_id ).first()
-    if vehicle_query:
+    fields = parse_fields(Vehicle, request.args)
+    snapshot_entry = detail_response(Vehicle, vehicle_id, request, "Vehicle encontrado", "Vehicle no existe!")
+    if snapshot_entry is not None:
+        return snapshot_entry
+    vehicle_entry = cached_detail(Vehicle, vehicle_id)
+    if vehicle_entry:
+        result, validators = vehicle_entry
+        validators = fields_validators(validators, fields)
+        if is_not_modified(request, validators):
+            return not_modified_response(validators)
         response_body = {
             "msg": "Vehicle encontrado",
-            "result": vehicle_query.serialize()
+            "result": project(result, fields)
         }
-        return jsonify(response_body), 200
+        return with_validators(jsonify(response_body), validators), 200
     else:
         response_body = {
             "msg": "Vehicle no existe!"
@@ -137,10 +273,105 @@ def vehicle_id(vehicle_id):
         return jsonify(response_body), 404
 
 
+@app.route('/people/popular', methods=['GET'])
+def popular_people():
+    response_body = {
+        "msg": "Ok",
+        "result": popular(Character, request.args)
+    }
+
+    return jsonify(response_body), 200
+
+@app.route('/planets/popular', methods=['GET'])
+def popular_planets():
+    response_body = {
+        "msg": "Ok",
+        "result": popular(Planet, request.args)
+    }
+
+    return jsonify(response_body), 200
+
+@app.route('/vehicles/popular', methods=['GET'])
+def popular_vehicles():
+    response_body = {
+        "msg": "Ok",
+        "result": popular(Vehicle, request.args)
+    }
+
+    return jsonify(response_body), 200
+
+@app.route('/changes', methods=['GET'])
+def load_changes():
+    result, next_cursor, more = changes_since(request.args)
+    response_body = {
+        "msg": "Ok",
+        "result": result,
+        "next": next_cursor,
+        "more": more
+    }
+
+    return jsonify(response_body), 200
+
+@app.route('/batch', methods=['POST'])
+def batch_requests():
+    response_body = {
+        "msg": "Ok",
+        "result": run_batch(request.get_json(silent=True), request)
+    }
+
+    return jsonify(response_body), 200
+
+@app.route('/search', methods=['GET'])
+def search_catalog():
+    q = request.args.get("q", "").strip()
+    if not q:
+        raise APIException("Falta el parametro 'q'", status_code=400)
+    limit = parse_limit(request.args)
+    offset = parse_int_arg(request.args, "offset", 0)
+    result, next_offset = search(q, limit, offset)
+    response_body = {
+        "msg": "Ok",
+        "result": result,
+        "next": next_offset
+    }
+
+    return jsonify(response_body), 200
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    response_body = {
+        "msg": "Ok",
+        "result": detail_cache.stats()
+    }
+
+    return jsonify(response_body), 200
+
+@app.route('/pool/stats', methods=['GET'])
+def load_pool_stats():
+    result = pool_stats(db.engine)
+    if "replicas" in app.extensions:
+        result.update(app.extensions["replicas"].stats())
+    response_body = {
+        "msg": "Ok",
+        "result": result
+    }
+
+    return jsonify(response_body), 200
+
 @app.route('/user/<int:user_id>/favorites', methods=['GET'])
 def load_user_favorites(user_id):
-    user_favorites_query = Favorites.query.filter_by(user_fk = user_id).all()
-    user_favorites = list(map(lambda item : item.serialize(), user_favorites_query))
+    expand = request.args.get("expand") in ("1", "true")
+    if expand and request.args.get("fields"):
+        raise APIException("'fields' no se puede combinar con 'expand'", status_code=400)
+    if expand:
+        # Targets come back in the same query through LEFT OUTER JOINs on the backrefs
+        user_favorites_query = Favorites.query.filter_by(user_fk = user_id).options(
+            joinedload(Favorites.planet), joinedload(Favorites.vehicle), joinedload(Favorites.character)).all()
+        user_favorites = list(map(lambda item : item.serialize_expanded(), user_favorites_query))
+    else:
+        query, serialize = select_fields(Favorites, request.args)
+        user_favorites_query = query.filter(Favorites.user_fk == user_id).all()
+        user_favorites = list(map(serialize, user_favorites_query))
     response_body = {
         "msg": "Ok",
         "result": user_favorites
@@ -148,13 +379,32 @@ def load_user_favorites(user_id):
 
     return jsonify(response_body), 200
 
+@app.route('/user/<int:user_id>/favorites/stream', methods=['GET'])
+def stream_user_favorites(user_id):
+    # Server-Sent Events: add/remove events for this user's favorites as they commit
+    return favorites_stream(user_id, request)
+
+@app.route('/user/<int:user_id>/favorites/batch', methods=['POST'])
+def batch_user_favorites(user_id):
+    request_body = request.get_json(silent=True)
+    # Either a bare list of operations or {"operations": [...]}
+    operations = request_body.get("operations") if isinstance(request_body, dict) else request_body
+    result = apply_batch(user_id, operations)
+    db.session.commit()
+    response_body = {
+        "msg": "Ok",
+        "result": result
+    }
+
+    return jsonify(response_body), 200
+
 @app.route('/planet', methods=['POST'])
 def create_planet():
     request_body = request.json
     planet_query = Planet.query.filter_by(name = request_body["name"]).first()
     if planet_query is None:
         create_planet = Planet(name = request_body["name"], url = request_body["url"], climate = request_body["climate"], 
-        created = request_body["created"], 
+        created = parse_datetime(request_body["created"]), 
         diameter = request_body["diameter"], 
         gravity = request_body["gravity"], 
         orbital_period = request_body["orbital_period"], 
@@ -162,7 +412,7 @@ def create_planet():
         rotation_period = request_body["rotation_period"],
         surface_water = request_body["surface_water"],
         terrain = request_body["terrain"],
-        edited = request_body["edited"],)
+        edited = parse_datetime(request_body["edited"]),)
         db.session.add(create_planet)
         db.session.commit()
         response_body = {
@@ -182,14 +432,14 @@ def create_vehicle():
     vehicle_query = Vehicle.query.filter_by(name = request_body["name"]).first()
     if vehicle_query is None:
         create_vehicle = Vehicle(name = request_body["name"], url = request_body["url"], cargo_capacity = request_body["cargo_capacity"], 
-        created = request_body["created"], 
+        created = parse_datetime(request_body["created"]), 
         crew = request_body["crew"], 
         length = request_body["length"], 
         manufacturer = request_body["manufacturer"], 
         max_atmosphering_speed = request_body["max_atmosphering_speed"],
         model = request_body["model"],
         vehicle_class = request_body["vehicle_class"],
-        edited = request_body["edited"],)
+        edited = parse_datetime(request_body["edited"]),)
         db.session.add(create_vehicle)
         db.session.commit()
         response_body = {
@@ -215,8 +465,8 @@ def create_character():
         birth_year = request_body["birth_year"],
         gender = request_body["gender"],
         homeworld = request_body["homeworld"],
-        created = request_body["created"],
-        edited = request_body["edited"],)
+        created = parse_datetime(request_body["created"]),
+        edited = parse_datetime(request_body["edited"]),)
         db.session.add(create_character)
         db.session.commit()
         response_body = {
@@ -229,14 +479,38 @@ def create_character():
             }
         return jsonify(response_body), 404
 
+@app.route('/people/bulk', methods=['POST'])
+def bulk_create_character():
+    response_body = {
+        "msg": "Ok",
+        "result": bulk_request(Character, request)
+    }
+    return jsonify(response_body), 200
+
+@app.route('/planet/bulk', methods=['POST'])
+def bulk_create_planet():
+    response_body = {
+        "msg": "Ok",
+        "result": bulk_request(Planet, request)
+    }
+    return jsonify(response_body), 200
+
+@app.route('/vehicle/bulk', methods=['POST'])
+def bulk_create_vehicle():
+    response_body = {
+        "msg": "Ok",
+        "result": bulk_request(Vehicle, request)
+    }
+    return jsonify(response_body), 200
+
 @app.route('/favorite/planet/<int:planet_id>', methods=['POST'])
 def create_favorite_planet(planet_id):
     request_body = request.json
-    planet_favorite = Favorites(user_fk = request_body["user_id"], planet_fk = planet_id)
-    db.session.add(planet_favorite)
+    created = add_favorite(request_body["user_id"], "planet", planet_id)
     db.session.commit()
     response_body = {
-        "msg": "Planeta creado con exito"
+        "msg": "Planeta creado con exito",
+        "created": created
     }
 
     return jsonify(response_body), 200
@@ -244,11 +518,11 @@ def create_favorite_planet(planet_id):
 @app.route('/favorite/people/<int:people_id>', methods=['POST'])
 def create_favorite_character(people_id):
     request_body = request.json
-    people_favorite = Favorites(user_fk = request_body["user_id"], character_fk = people_id)
-    db.session.add(people_favorite)
+    created = add_favorite(request_body["user_id"], "character", people_id)
     db.session.commit()
     response_body = {
-        "msg": "Personaje creado con exito"
+        "msg": "Personaje creado con exito",
+        "created": created
     }
 
     return jsonify(response_body), 200
@@ -256,11 +530,11 @@ def create_favorite_character(people_id):
 @app.route('/favorite/vehicle/<int:vehicle_id>', methods=['POST'])
 def create_favorite_vehicle(vehicle_id):
     request_body = request.json
-    vehicle_favorite = Favorites(user_fk = request_body["user_id"], vehicle_fk = vehicle_id)
-    db.session.add(vehicle_favorite)
+    created = add_favorite(request_body["user_id"], "vehicle", vehicle_id)
     db.session.commit()
     response_body = {
-        "msg": "Vehiculo creado con exito"
+        "msg": "Vehiculo creado con exito",
+        "created": created
     }
 
     return jsonify(response_body), 200
@@ -269,9 +543,7 @@ def create_favorite_vehicle(vehicle_id):
 @app.route('/favorite/vehicle/<int:vehicle_id>', methods=['DELETE'])
 def delete_favorite_vehicle(vehicle_id):
     request_body = request.json
-    vehicle_delete = Favorites.query.filter_by(user_fk = request_body["user_id"], vehicle_fk = vehicle_id).first()
-    if vehicle_delete: 
-        db.session.delete(vehicle_delete)
+    if remove_favorite(request_body["user_id"], "vehicle", vehicle_id):
         db.session.commit()
         response_body = {
             "msg": "Vehiculo eliminado con exito"
@@ -286,9 +558,7 @@ def delete_favorite_vehicle(vehicle_id):
 @app.route('/favorite/planet/<int:planet_id>', methods=['DELETE'])
 def delete_favorite_planet(planet_id):
     request_body = request.json
-    planet_delete = Favorites.query.filter_by(user_fk = request_body["user_id"], planet_fk = planet_id).first()
-    if planet_delete: 
-        db.session.delete(planet_delete)
+    if remove_favorite(request_body["user_id"], "planet", planet_id):
         db.session.commit()
         response_body = {
             "msg": "Planeta eliminado con exito"
@@ -304,9 +574,7 @@ def delete_favorite_planet(planet_id):
 @app.route('/favorite/people/<int:people_id>', methods=['DELETE'])
 def delete_favorite_people(people_id):
     request_body = request.json
-    character_delete = Favorites.query.filter_by(user_fk = request_body["user_id"], character_fk = people_id).first()
-    if character_delete: 
-        db.session.delete(character_delete)
+    if remove_favorite(request_body["user_id"], "character", people_id):
         db.session.commit()
         response_body = {
             "msg": "Personaje eliminado con exito"
@@ -357,7 +625,7 @@ def login_user():
         return jsonify({"msg": "Usuario o contraseña incorrecta"}), 404
 
     else:
-        access_token = create_access_token(identity=user_login.id)
+        access_token = create_access_token(identity=str(user_login.id))
         return jsonify({ "token": access_token, "user_id": user_login.id })
   
 @app.route("/protected", methods=["GET"])
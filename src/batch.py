@@ -0,0 +1,138 @@
+"""
+Composite requests: POST /batch runs several API calls in one round trip
+
+    {"requests": [
+        {"id": "me", "method": "GET", "path": "/user/1"},
+        {"id": "fav", "method": "POST", "path": "/favorite/planet/3", "body": {"user_id": 1}},
+        {"id": "list", "method": "GET", "path": "/user/1/favorites"}
+    ]}
+
+Sub-requests go through the regular routes, including their hooks and error
+handlers, and the results come back in request order: {id, status, headers, body}.
+Writes run one after another in the batch's own app context, so they share its
+DB session. A run of consecutive GET/HEAD sub-requests with no write between them
+is independent, so those run concurrently on a bounded thread pool
+(BATCH_WORKERS). Each gets its own app context, since a Session must not be
+shared between threads. Reads that come after a write in the batch are sent with
+X-Read-Primary, so they see it even with read replicas.
+"""
+import os
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, g
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from models import db
+from utils import APIException
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", 50))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 4))
+READ_METHODS = ("GET", "HEAD")
+# Streaming routes never finish inside a batch; /batch itself would recurse.
+EXCLUDED_ENDPOINTS = {"batch_requests", "stream_user_favorites", "static"}
+FORWARDED_HEADERS = ("Authorization",)
+DROPPED_HEADERS = {"accept-encoding", "content-length", "content-type", "host"}
+
+executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+
+def _parse_item(index, item):
+    if not isinstance(item, dict):
+        raise ValueError("se esperaba un objeto")
+    method = str(item.get("method", "GET")).upper()
+    path = item.get("path")
+    if not isinstance(path, str) or not path.startswith("/"):
+        raise ValueError("'path' debe empezar con /")
+    headers = item.get("headers") or {}
+    if not isinstance(headers, dict):
+        raise ValueError("'headers' debe ser un objeto")
+    return {"id": item.get("id", index), "method": method, "path": path, "body": item.get("body"), "headers": headers}
+
+def _check_route(app, item):
+    adapter = app.url_map.bind("localhost")
+    try:
+        endpoint, _ = adapter.match(item["path"].split("?", 1)[0], method=item["method"])
+    except NotFound:
+        return 404, "Ruta no existe!"
+    except MethodNotAllowed:
+        return 405, "Metodo no permitido"
+    if endpoint in EXCLUDED_ENDPOINTS:
+        return 400, "Ruta no disponible en /batch"
+    return None
+
+@contextmanager
+def _own_globals():
+    # Sub-requests in the batch's app context would otherwise share `g` with it
+    # (metrics timers, memoized table versions, replica routing).
+    saved = dict(g.__dict__)
+    g.__dict__.clear()
+    try:
+        yield
+    finally:
+        g.__dict__.clear()
+        g.__dict__.update(saved)
+
+def _run(app, item, headers):
+    error = _check_route(app, item)
+    if error is not None:
+        return {"id": item["id"], "status": error[0], "headers": {}, "body": {"msg": error[1]}}
+    headers = dict(headers)
+    headers.update((name, value) for name, value in item["headers"].items() if name.lower() not in DROPPED_HEADERS)
+    with app.test_request_context(item["path"], method=item["method"], json=item["body"], headers=headers):
+        try:
+            response = app.full_dispatch_request()
+        except Exception:
+            app.logger.exception("Batch sub-request %s %s failed", item["method"], item["path"])
+            db.session.rollback()
+            return {"id": item["id"], "status": 500, "headers": {}, "body": {"msg": "Error interno"}}
+        try:
+            body = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+            response_headers = {name: value for name, value in response.headers.items()
+                                if name.lower() not in ("content-length", "content-type")}
+            return {"id": item["id"], "status": response.status_code, "headers": response_headers, "body": body}
+        finally:
+            response.close()
+
+def _run_in_batch_context(app, item, headers):
+    with _own_globals():
+        return _run(app, item, headers)
+
+def run_batch(request_body, request):
+    if isinstance(request_body, dict):
+        request_body = request_body.get("requests")
+    if not isinstance(request_body, list):
+        raise APIException("Se esperaba una lista de requests", status_code=400)
+    if len(request_body) > BATCH_MAX_REQUESTS:
+        raise APIException("Maximo %d requests por lote" % BATCH_MAX_REQUESTS, status_code=400)
+
+    app = current_app._get_current_object()
+    headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    results = [None] * len(request_body)
+    reads = []
+    wrote = False
+
+    def flush_reads():
+        # A lone read runs inline; several run concurrently, each in a fresh app
+        # context with its own session.
+        if len(reads) == 1:
+            index, item, read_headers = reads.pop()
+            results[index] = _run_in_batch_context(app, item, read_headers)
+            return
+        futures = [(index, executor.submit(_run, app, item, read_headers)) for index, item, read_headers in reads]
+        for index, future in futures:
+            results[index] = future.result()
+        reads.clear()
+
+    for index, item in enumerate(request_body):
+        try:
+            item = _parse_item(index, item)
+        except ValueError as error:
+            item_id = item.get("id", index) if isinstance(item, dict) else index
+            results[index] = {"id": item_id, "status": 400, "headers": {}, "body": {"msg": str(error)}}
+            continue
+        if item["method"] in READ_METHODS:
+            reads.append((index, item, dict(headers, **{"X-Read-Primary": "1"}) if wrote else headers))
+            continue
+        flush_reads()
+        results[index] = _run_in_batch_context(app, item, headers)
+        wrote = True
+    flush_reads()
+    return results
@@ -0,0 +1,184 @@
+"""
+Bulk import of catalog rows: set-based duplicate detection and batched inserts
+in a single transaction
+"""
+import json
+from datetime import datetime, timezone
+from functools import lru_cache
+from sqlalchemy import insert
+from models import db, Character, Planet, Vehicle
+from utils import APIException, NDJSON_MIMETYPE
+
+BULK_MODELS = {
+    "people": Character,
+    "planet": Planet,
+    "vehicle": Vehicle,
+}
+INSERT_BATCH_SIZE = 1000
+LOOKUP_BATCH_SIZE = 500
+# Value ranges of the integer column types, as enforced by Postgres
+INTEGER_RANGES = (
+    (db.SmallInteger, 2 ** 15),
+    (db.BigInteger, 2 ** 63),
+    (db.Integer, 2 ** 31),
+)
+
+def parse_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    # SWAPI dumps use "2014-12-09T13:50:51.644000Z"
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def load_records(text):
+    # Accepts either a JSON array or NDJSON (one object per line).
+    text = text.strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def _fields(model):
+    # Generated columns (e.g. Planet.diameter_value) are computed by the database and
+    # read-only ones (changed_at) stamped by the server.
+    return [column for column in model.__table__.columns
+            if not column.primary_key and column.computed is None and not column.info.get("read_only")]
+
+def _unique_keys(model):
+    return [column.name for column in model.__table__.columns if column.unique or column.name == "name"]
+
+def _integer(column):
+    # 172, "172" and "1,200" are accepted; "unknown", 1.5 and true are not.
+    limit = next(limit for column_type, limit in INTEGER_RANGES if isinstance(column.type, column_type))
+    invalid = "'%s' debe ser un entero" % column.name
+    out_of_range = "'%s' esta fuera de rango" % column.name
+
+    def coerce(value):
+        if type(value) is not int:
+            if isinstance(value, str):
+                value = value.strip().replace(",", "")
+            elif isinstance(value, float) and value.is_integer():
+                value = int(value)
+            if isinstance(value, bool) or not isinstance(value, (int, str)):
+                raise ValueError(invalid)
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(invalid)
+        if not -limit <= value < limit:
+            raise ValueError(out_of_range)
+        return value
+    return coerce
+
+def _string(column):
+    length = column.type.length
+    invalid = "'%s' debe ser un texto" % column.name
+    too_long = "'%s' admite como maximo %d caracteres" % (column.name, length or 0)
+
+    def coerce(value):
+        if type(value) is not str:
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError(invalid)
+            value = str(value)
+        if length is not None and len(value) > length:
+            raise ValueError(too_long)
+        return value
+    return coerce
+
+def _coercer(column):
+    # Checked up front so a bad record is reported in `errors` instead of failing the
+    # whole INSERT (Postgres rejects "unknown" in an integer column).
+    if isinstance(column.type, db.DateTime):
+        return parse_datetime
+    if isinstance(column.type, db.Integer):
+        return _integer(column)
+    if isinstance(column.type, db.String):
+        return _string(column)
+    return None
+
+@lru_cache(maxsize=None)
+def _columns(model):
+    # (name, coercer or None, nullable) per importable column, built once per model.
+    return tuple((column.name, _coercer(column), column.nullable) for column in _fields(model))
+
+def _clean(model, record):
+    row = {}
+    for name, coerce, nullable in _columns(model):
+        if name not in record:
+            raise ValueError("falta el campo '%s'" % name)
+        value = record[name]
+        if value is None:
+            if not nullable:
+                raise ValueError("'%s' no puede ser nulo" % name)
+        elif coerce is not None:
+            value = coerce(value)
+        row[name] = value
+    return row
+
+def _existing_values(model, key, values):
+    column = getattr(model, key)
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+        chunk = values[start:start + LOOKUP_BATCH_SIZE]
+        found.update(value for (value,) in db.session.query(column).filter(column.in_(chunk)))
+    return found
+
+def bulk_import(model, records):
+    """Insert `records` into `model`'s table, returning inserted/skipped/failed counts.
+
+    Every value is checked against its column type first; records that do not fit
+    are reported in `errors` and left out. Duplicates (by name and any unique column)
+    are detected against the database with batched IN lookups and within the payload
+    itself. Valid rows are sent as executemany batches (multi-row VALUES on psycopg2,
+    cursor.executemany on SQLite) and committed once, so the whole import is one
+    transaction.
+    """
+    errors = []
+    rows = []
+    for index, record in enumerate(records):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("se esperaba un objeto")
+            rows.append(_clean(model, record))
+        except (ValueError, TypeError) as error:
+            errors.append({"index": index, "error": str(error)})
+
+    keys = _unique_keys(model)
+    seen = {key: _existing_values(model, key, {row[key] for row in rows if row[key] is not None}) for key in keys}
+    new_rows = []
+    for row in rows:
+        if any(row[key] in seen[key] for key in keys if row[key] is not None):
+            continue
+        for key in keys:
+            seen[key].add(row[key])
+        new_rows.append(row)
+
+    try:
+        statement = insert(model.__table__)
+        for start in range(0, len(new_rows), INSERT_BATCH_SIZE):
+            db.session.execute(statement, new_rows[start:start + INSERT_BATCH_SIZE])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        "inserted": len(new_rows),
+        "skipped": len(rows) - len(new_rows),
+        "failed": len(errors),
+        "errors": errors
+    }
+
+def bulk_request(model, request):
+    if request.mimetype == NDJSON_MIMETYPE:
+        try:
+            records = load_records(request.get_data(as_text=True))
+        except ValueError:
+            raise APIException("NDJSON invalido", status_code=400)
+    else:
+        records = request.get_json(silent=True)
+    if not isinstance(records, list):
+        raise APIException("Se esperaba una lista de objetos", status_code=400)
+    return bulk_import(model, records)
@@ -0,0 +1,121 @@
+"""
+In-process LRU + TTL cache for serialized entity details
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import Character, Planet, Vehicle
+from conditional import entity_validators
+from serializers import column_names, row_serializer
+
+CACHED_MODELS = (Character, Planet, Vehicle)
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+detail_cache = LRUCache(
+    maxsize=int(os.getenv("DETAIL_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("DETAIL_CACHE_TTL", 60)),
+)
+
+def _select(model):
+    return model.query.with_entities(*(getattr(model, name) for name in column_names(model)))
+
+def _serialize(model, row):
+    return row_serializer(column_names(model))(row)
+
+def cached_detail(model, entity_id):
+    # Returns (serialized row, validators) or None when the row does not exist.
+    key = (model.__tablename__, entity_id)
+    entry = detail_cache.get(key)
+    if entry is None:
+        row = _select(model).filter(model.id == entity_id).first()
+        if row is None:
+            return None
+        entry = (_serialize(model, row), entity_validators(model, row.id, row.edited))
+        detail_cache.set(key, entry)
+    return entry
+
+def cached_details(model, entity_ids):
+    # Multi-get: cached ids never reach the database, the rest are fetched with a
+    # single IN query and cached. Returns (results in request order, missing ids).
+    found = {}
+    missing = []
+    for entity_id in entity_ids:
+        entry = detail_cache.get((model.__tablename__, entity_id))
+        if entry is None:
+            missing.append(entity_id)
+        else:
+            found[entity_id] = entry[0]
+    if missing:
+        for row in _select(model).filter(model.id.in_(missing)):
+            entry = (_serialize(model, row), entity_validators(model, row.id, row.edited))
+            detail_cache.set((model.__tablename__, row.id), entry)
+            found[row.id] = entry[0]
+    result = [found[entity_id] for entity_id in entity_ids if entity_id in found]
+    not_found = [entity_id for entity_id in entity_ids if entity_id not in found]
+    return result, not_found
+
+# Any session that flushes a cached model (API handlers, Flask-Admin, CLI commands)
+# drops the affected entries once the transaction commits.
+@event.listens_for(Session, "after_flush")
+def _collect_keys(session, flush_context):
+    keys = session.info.setdefault("detail_cache_keys", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, CACHED_MODELS):
+            keys.add((obj.__tablename__, obj.id))
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_keys(session):
+    for key in session.info.pop("detail_cache_keys", ()):
+        detail_cache.invalidate(key)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_keys(session):
+    session.info.pop("detail_cache_keys", None)
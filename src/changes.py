@@ -0,0 +1,102 @@
+"""
+Change feed for client delta sync: GET /changes?since=<cursor>
+
+Created and updated rows come from the indexed `changed_at` columns of Character,
+Planet and Vehicle, which the server stamps on every insert and update (the
+client-supplied `edited` plays no part). Deletes come from the tombstones table,
+which triggers fill. Both streams are merged in time order. The opaque cursor
+holds the last (changed_at, kind, id) sent and the last tombstone id, so every
+page resumes exactly where the previous one ended. The cost of a sync grows with
+the number of changes, not with the size of the catalog.
+
+Changes from the last CHANGES_SETTLE_SECONDS are held back. `changed_at` is
+stamped before the commit, so a slow transaction could otherwise become visible
+behind a cursor that already moved past it.
+"""
+import os
+import json
+import heapq
+import base64
+from datetime import datetime, timedelta
+from itertools import islice
+from models import Character, Planet, Vehicle, Tombstone
+from serializers import column_names, row_serializer
+from utils import APIException, parse_limit
+
+# Position in this tuple breaks ties between rows of different tables changed at the
+# same instant. Keep the tables in sync with migration b61d04e9c5a2.
+CHANGE_KINDS = (
+    ("character", Character),
+    ("planet", Planet),
+    ("vehicle", Vehicle),
+)
+CHANGES_SETTLE_SECONDS = float(os.getenv("CHANGES_SETTLE_SECONDS", 2))
+
+def _encode_cursor(position, tombstone_id):
+    if position is not None:
+        position = [position[0].isoformat(), position[1], position[2]]
+    return base64.urlsafe_b64encode(json.dumps([position, tombstone_id]).encode()).decode()
+
+def _decode_cursor(cursor):
+    # -> ((changed_at, kind index, id) of the last row sent or None, last tombstone id)
+    if not cursor:
+        return None, 0
+    try:
+        position, tombstone_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if position is not None:
+            changed_at, kind, entity_id = position
+            position = (datetime.fromisoformat(changed_at), int(kind), int(entity_id))
+        return position, int(tombstone_id)
+    except (ValueError, TypeError):
+        raise APIException("Cursor invalido", status_code=400)
+
+def _after(model, kind, position):
+    # Keyset over (changed_at, kind, id); the kind is constant within one table.
+    changed_at, last_kind, last_id = position
+    if kind > last_kind:
+        return model.changed_at >= changed_at
+    if kind < last_kind:
+        return model.changed_at > changed_at
+    return (model.changed_at > changed_at) | ((model.changed_at == changed_at) & (model.id > last_id))
+
+def _upserts(position, horizon, limit):
+    changes = []
+    for kind, (name, model) in enumerate(CHANGE_KINDS):
+        names = column_names(model)
+        serialize = row_serializer(names)
+        query = model.query.with_entities(*(getattr(model, column) for column in names)).filter(model.changed_at <= horizon)
+        if position is not None:
+            query = query.filter(_after(model, kind, position))
+        for row in query.order_by(model.changed_at, model.id).limit(limit):
+            change = {"type": name, "id": row.id, "op": "upsert", "at": row.changed_at, "data": serialize(row)}
+            changes.append(((row.changed_at, kind, row.id), change))
+    changes.sort(key=lambda item: item[0])
+    return changes
+
+def _deletes(tombstone_id, horizon, limit):
+    changes = []
+    tombstones = Tombstone.query.filter(Tombstone.id > tombstone_id).order_by(Tombstone.id).limit(limit)
+    for tombstone in tombstones:
+        # Stop at the first unsettled one so the cursor never skips over it.
+        if tombstone.deleted_at > horizon:
+            break
+        change = {"type": tombstone.kind, "id": tombstone.entity_id, "op": "delete", "at": tombstone.deleted_at}
+        changes.append((tombstone.id, change))
+    return changes
+
+def changes_since(args):
+    """One page of changes after ?since, returning (changes, next cursor, more)."""
+    position, tombstone_id = _decode_cursor(args.get("since"))
+    limit = parse_limit(args)
+    horizon = datetime.utcnow() - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+    upserts = (("upsert", key, change) for key, change in _upserts(position, horizon, limit + 1))
+    deletes = (("delete", key, change) for key, change in _deletes(tombstone_id, horizon, limit + 1))
+    merged = list(islice(heapq.merge(upserts, deletes, key=lambda item: item[2]["at"]), limit + 1))
+    result = []
+    for source, key, change in merged[:limit]:
+        if source == "upsert":
+            position = key
+        else:
+            tombstone_id = key
+        result.append(change)
+    return result, _encode_cursor(position, tombstone_id), len(merged) > limit
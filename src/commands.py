@@ -0,0 +1,49 @@
+"""
+Flask CLI commands, registered with `setup_commands(app)`
+"""
+import time
+import click
+from bulk import BULK_MODELS, bulk_import, load_records
+from seed import seed_database
+from popularity import rebuild_counts
+
+def setup_commands(app):
+
+    @app.cli.command("import")
+    @click.argument("kind", type=click.Choice(sorted(BULK_MODELS)))
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    def import_command(kind, path):
+        """Bulk import a JSON array or NDJSON file of people, planets or vehicles."""
+        with open(path, encoding="utf-8") as source:
+            records = load_records(source.read())
+        result = bulk_import(BULK_MODELS[kind], records)
+        for error in result["errors"]:
+            click.echo("fila %(index)d: %(error)s" % error, err=True)
+        click.echo("inserted=%(inserted)d skipped=%(skipped)d failed=%(failed)d" % result)
+
+    @app.cli.command("seed")
+    @click.option("--users", default=0, help="Users to create")
+    @click.option("--characters", default=0, help="Characters to create")
+    @click.option("--planets", default=0, help="Planets to create")
+    @click.option("--vehicles", default=0, help="Vehicles to create")
+    @click.option("--favorites", default=0, help="Favorites to create across existing users and targets")
+    @click.option("--seed", "random_seed", default=42, help="RNG seed; the same seed gives the same data")
+    @click.option("--skew", default=1.0, help="Zipf exponent of favorites per user (0 = uniform)")
+    @click.option("--batch-size", default=10000, help="Rows per write batch")
+    def seed_command(users, characters, planets, vehicles, favorites, random_seed, skew, batch_size):
+        """Generate deterministic synthetic data in bulk."""
+        counts = {"users": users, "characters": characters, "planets": planets, "vehicles": vehicles,
+                  "favorites": favorites}
+        start = time.perf_counter()
+        written = seed_database(counts, seed=random_seed, skew=skew, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        total = sum(written.values())
+        for table, count in written.items():
+            click.echo("%s=%d" % (table, count))
+        click.echo("%d rows in %.2fs (%.0f rows/s)" % (total, elapsed, total / elapsed if elapsed else 0))
+
+    @app.cli.command("reconcile-popularity")
+    def reconcile_popularity_command():
+        """Rebuild the favorite counters behind the /popular routes from Favorites."""
+        for kind, count in rebuild_counts().items():
+            click.echo("%s=%d" % (kind, count))
@@ -0,0 +1,82 @@
+"""
+gzip / brotli response compression negotiated from Accept-Encoding
+
+Responses at or above COMPRESS_MIN_SIZE bytes are compressed in an after_request
+hook. Bodies that carry an ETag are kept compressed in an LRU keyed by
+(path, ETag, encoding). List ETags move with the table version (see
+conditional.list_validators), so an unchanged list is only compressed once. The
+list routes call `cached_compressed` before querying, which also skips the query
+and the serialization on a hit.
+
+brotli is used when the `brotli` package is installed and the client prefers it.
+"""
+import os
+import gzip
+from flask import request, Response
+from cache import LRUCache
+from conditional import with_validators
+from utils import wants_stream
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 6))
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/html", "text/plain"}
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+compressed_cache = LRUCache(
+    maxsize=int(os.getenv("COMPRESS_CACHE_SIZE", 256)),
+    ttl=float(os.getenv("COMPRESS_CACHE_TTL", 300)),
+)
+
+def negotiate_encoding():
+    # Highest q-value wins; on a tie the order of ENCODINGS (br first) decides.
+    return request.accept_encodings.best_match(ENCODINGS)
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_LEVEL)
+    # mtime=0 keeps the output byte-for-byte stable for the same input.
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+def _cache_key(etag, encoding):
+    return (request.full_path, etag, encoding)
+
+def cached_compressed(validators):
+    """Response with the cached compressed body for this request, or None."""
+    encoding = negotiate_encoding()
+    # Streamed lists (NDJSON or ?stream=1) are never compressed or cached here.
+    if validators is None or encoding is None or wants_stream(request):
+        return None
+    body = compressed_cache.get(_cache_key(validators[0], encoding))
+    if body is None:
+        return None
+    response = Response(body, mimetype="application/json")
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return with_validators(response, validators)
+
+def setup_compression(app):
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+                or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate_encoding()
+        if encoding is None or response.content_length < COMPRESS_MIN_SIZE:
+            return response
+        etag = response.get_etag()[0]
+        key = _cache_key(etag, encoding) if etag else None
+        body = compressed_cache.get(key) if key else None
+        if body is None:
+            body = compress(response.get_data(), encoding)
+            if key:
+                compressed_cache.set(key, body)
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,91 @@
+"""
+Conditional GET support (ETag / Last-Modified)
+
+Detail validators come from the entity's `edited` column. List validators come
+from the table_versions row of the table, which triggers bump on every insert,
+update and delete, so one primary key lookup answers them.
+"""
+import hashlib
+from contextlib import contextmanager
+from datetime import timezone
+from flask import Response, g
+from models import db, TableVersion
+from utils import response_mimetype
+
+def _validators(parts, edited):
+    etag = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+    last_modified = edited.replace(microsecond=0, tzinfo=timezone.utc) if edited else None
+    return etag, last_modified
+
+def entity_validators(model, entity_id, edited):
+    return _validators((model.__tablename__, entity_id, edited.isoformat()), edited)
+
+def fields_validators(validators, fields):
+    # A ?fields= projection is its own representation of the entity, so it gets its
+    # own tag; otherwise a partial body could satisfy If-None-Match for the full one.
+    if validators is None or fields is None:
+        return validators
+    etag, last_modified = validators
+    return hashlib.sha1(("%s:%s" % (etag, ",".join(fields))).encode()).hexdigest(), last_modified
+
+def table_version(model):
+    # (version, changed_at) of the table, or (0, None) before its row exists.
+    # Memoized per request, since several layers ask for it.
+    versions = g.setdefault("table_versions", {})
+    if model.__tablename__ not in versions:
+        row = db.session.query(TableVersion.version, TableVersion.changed_at).filter(
+            TableVersion.table_name == model.__tablename__).first()
+        versions[model.__tablename__] = tuple(row) if row is not None else (0, None)
+    return versions[model.__tablename__]
+
+@contextmanager
+def deferred_version_bump(connection, table_name):
+    """Bulk loads on SQLite: bump `table_name`'s version once instead of once per
+    inserted row, by dropping its insert trigger for the duration of the block.
+
+    Like search.deferred_search_index, everything happens inside the caller's
+    transaction. Postgres bumps once per statement already and is left alone.
+    """
+    trigger = "%s_version_ai" % table_name
+    trigger_sql = None
+    if connection.dialect.name == "sqlite":
+        trigger_sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (trigger,)).scalar()
+    if trigger_sql is None:
+        yield
+        return
+    # The bump is DML, so it also opens pysqlite's implicit transaction before the DDL.
+    connection.exec_driver_sql(
+        "UPDATE table_versions SET version = version + 1, changed_at = strftime('%Y-%m-%d %H:%M:%f', 'now') || '000' "
+        "WHERE table_name = ?", (table_name,))
+    connection.exec_driver_sql("DROP TRIGGER %s" % trigger)
+    yield
+    connection.exec_driver_sql(trigger_sql)
+
+def list_validators(model, request):
+    # The query string and the negotiated representation (JSON page or NDJSON
+    # stream) are part of the tag so each page and format differs.
+    version, changed_at = table_version(model)
+    parts = (model.__tablename__, version, request.query_string.decode(), response_mimetype(request))
+    return _validators(parts, changed_at)
+
+def is_not_modified(request, validators):
+    if validators is None:
+        return False
+    etag, last_modified = validators
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+def with_validators(response, validators):
+    if validators is not None:
+        etag, last_modified = validators
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+    return response
+
+def not_modified_response(validators):
+    return with_validators(Response(status=304), validators)
@@ -0,0 +1,248 @@
+"""
+Favorites change events, fanned out to Server-Sent Events streams
+
+    EVENTS_BACKEND        "memory" (default, one process) or a redis:// URL to fan
+                          out across gunicorn workers and instances
+    SSE_HEARTBEAT         seconds between keep-alive comments (default 15)
+    SSE_QUEUE_SIZE        events buffered per client before it is cut off (default 100)
+    SSE_HISTORY           events kept per user for Last-Event-ID resume (default 100)
+    SSE_MAX_SECONDS       a stream is closed after this long; EventSource reconnects
+                          and resumes, which keeps threads recycling (default 300)
+    SSE_MAX_STREAMS       open streams per worker process (default 56); further clients
+                          get 503 with a retry hint. Each stream holds a thread, and
+                          gunicorn.conf.py adds these threads on top of
+                          GUNICORN_THREADS, so regular requests keep theirs
+
+add_favorite / remove_favorite / apply_batch queue an event on the session, and it
+is published only once the transaction commits. The Broker keeps a bounded history
+per user and a bounded queue per connected client. When a client's queue fills
+up, the publisher does not block: the stream is closed after what was queued.
+On reconnect the client resumes from Last-Event-ID when that id is still in the
+history. Otherwise it gets `resync` and reloads GET /user/<id>/favorites.
+"""
+import os
+import json
+import logging
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict, deque
+from flask import Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", 15))
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", 100))
+SSE_HISTORY = int(os.getenv("SSE_HISTORY", 100))
+SSE_HISTORY_USERS = int(os.getenv("SSE_HISTORY_USERS", 10000))
+SSE_MAX_SECONDS = float(os.getenv("SSE_MAX_SECONDS", 300))
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", 56))
+SSE_BUSY_RETRY = 10
+REDIS_CHANNEL = "favorites-events"
+
+logger = logging.getLogger(__name__)
+
+class Subscriber:
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+class MemoryBackend:
+    """Delivers straight to the local broker: enough for a single process."""
+
+    def start(self, dispatch):
+        self._dispatch = dispatch
+
+    def publish(self, message):
+        self._dispatch(message)
+
+class RedisBackend:
+    """Redis pub/sub: every worker publishes to one channel and dispatches what it
+    receives, so each process sees all events in the same order."""
+
+    def __init__(self, url):
+        import redis  # optional dependency, only needed with EVENTS_BACKEND=redis://...
+        self._client = redis.Redis.from_url(url)
+        self._thread = None
+
+    def start(self, dispatch):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{REDIS_CHANNEL: lambda message: dispatch(json.loads(message["data"]))})
+        self._thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def publish(self, message):
+        self._client.publish(REDIS_CHANNEL, json.dumps(message))
+
+class Broker:
+    def __init__(self, backend, queue_size=SSE_QUEUE_SIZE, history=SSE_HISTORY, history_users=SSE_HISTORY_USERS,
+                 max_streams=SSE_MAX_STREAMS):
+        self.backend = backend
+        self.queue_size = queue_size
+        self.history_size = history
+        self.history_users = history_users
+        self.max_streams = max_streams
+        self.streams = 0
+        self.rejected = 0
+        self._subscribers = {}
+        self._history = OrderedDict()
+        self._lock = threading.Lock()
+        self._started = False
+        self._pid = None
+
+    def _ensure_started(self):
+        # Started lazily, and again after a fork, so each gunicorn worker runs its own listener.
+        if not self._started or self._pid != os.getpid():
+            with self._lock:
+                if not self._started or self._pid != os.getpid():
+                    self.backend.start(self.dispatch)
+                    self._started = True
+                    self._pid = os.getpid()
+
+    def publish(self, user_id, payload):
+        self._ensure_started()
+        message = dict(payload, id=uuid.uuid4().hex, user_id=user_id)
+        self.backend.publish(message)
+
+    def dispatch(self, message):
+        user_id = message["user_id"]
+        with self._lock:
+            history = self._history.get(user_id)
+            if history is None:
+                history = self._history[user_id] = deque(maxlen=self.history_size)
+                while len(self._history) > self.history_users:
+                    self._history.popitem(last=False)
+            self._history.move_to_end(user_id)
+            history.append(message)
+            for subscriber in self._subscribers.get(user_id, ()):
+                if subscriber.overflowed:
+                    continue
+                try:
+                    subscriber.queue.put_nowait(message)
+                except queue.Full:
+                    subscriber.overflowed = True
+
+    def subscribe(self, user_id, last_event_id=None):
+        """Register a client. Returns (subscriber, backlog); backlog is None when
+        last_event_id is no longer in the history and the client must resync."""
+        self._ensure_started()
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            backlog = []
+            if last_event_id:
+                history = list(self._history.get(user_id, ()))
+                ids = [message["id"] for message in history]
+                backlog = history[ids.index(last_event_id) + 1:] if last_event_id in ids else None
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber, backlog
+
+    def unsubscribe(self, user_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def open_stream(self):
+        """Take one of this process' stream slots; False when all are in use."""
+        with self._lock:
+            if self.streams >= self.max_streams:
+                self.rejected += 1
+                return False
+            self.streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock:
+            self.streams -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": type(self.backend).__name__,
+                "users": len(self._subscribers),
+                "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+                "streams": self.streams,
+                "max_streams": self.max_streams,
+                "rejected": self.rejected
+            }
+
+def _backend_from_env():
+    url = os.getenv("EVENTS_BACKEND", "memory")
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url)
+    return MemoryBackend()
+
+broker = Broker(_backend_from_env())
+
+def queue_favorite_event(session, user_id, op, target, target_id):
+    # user_id can arrive as "3" from a JSON body; streams subscribe with the int
+    # from the route, and the key has to match.
+    session.info.setdefault("favorite_events", []).append(
+        (int(user_id), {"op": op, "type": target, "target_id": target_id}))
+
+@event.listens_for(Session, "after_commit")
+def _publish_events(session):
+    for user_id, payload in session.info.pop("favorite_events", ()):
+        # The write is already committed; a backend outage only costs the live update.
+        try:
+            broker.publish(user_id, payload)
+        except Exception:
+            logger.exception("Could not publish favorites event for user %s", user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_events(session):
+    session.info.pop("favorite_events", None)
+
+def _format(message):
+    data = {key: value for key, value in message.items() if key != "id"}
+    return "id: %s\nevent: favorite\ndata: %s\n\n" % (message["id"], json.dumps(data))
+
+def _stream(subscriber, backlog):
+    yield "retry: 3000\n\n"
+    if backlog is None:
+        yield "event: resync\ndata: {}\n\n"
+    else:
+        for message in backlog:
+            yield _format(message)
+    deadline = time.monotonic() + SSE_MAX_SECONDS
+    while time.monotonic() < deadline:
+        if subscriber.overflowed and subscriber.queue.empty():
+            # Everything queued has been sent; the client reconnects with the
+            # last id it saw and picks up the rest from the history.
+            return
+        try:
+            message = subscriber.queue.get(timeout=min(SSE_HEARTBEAT, max(deadline - time.monotonic(), 0)))
+        except queue.Empty:
+            yield ": heartbeat\n\n"
+            continue
+        yield _format(message)
+
+def _busy_response():
+    response = Response("retry: %d\n\n" % (SSE_BUSY_RETRY * 1000), status=503, mimetype="text/event-stream")
+    response.headers["Retry-After"] = str(SSE_BUSY_RETRY)
+    return response
+
+def favorites_stream(user_id, request):
+    if not broker.open_stream():
+        return _busy_response()
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        subscriber, backlog = broker.subscribe(user_id, last_event_id)
+    except Exception:
+        # e.g. Redis unreachable: no response will be closed to give the slot back.
+        broker.close_stream()
+        raise
+
+    def close():
+        # Runs when the server closes the response, even if the stream never started.
+        broker.unsubscribe(user_id, subscriber)
+        broker.close_stream()
+
+    response = Response(_stream(subscriber, backlog), mimetype="text/event-stream")
+    response.call_on_close(close)
+    response.headers["Cache-Control"] = "no-cache"
+    # Keeps nginx-style proxies from buffering the stream.
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,226 @@
+"""
+Favorites writes: single-statement upserts and deletes keyed by (user, target),
+with the per-target counters in favorite_counts updated in the same transaction
+and a change event queued for the SSE streams (published on commit, see events.py)
+"""
+from sqlalchemy import delete, insert as generic_insert
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, User, Planet, Vehicle, Character, Favorites, FavoriteCount
+from utils import APIException
+from events import queue_favorite_event
+
+TARGET_COLUMNS = {
+    "planet": Favorites.planet_fk,
+    "vehicle": Favorites.vehicle_fk,
+    "character": Favorites.character_fk,
+}
+TARGET_MODELS = {
+    "planet": Planet,
+    "vehicle": Vehicle,
+    "character": Character,
+}
+# The routes call characters "people"; both names are accepted in batches.
+TARGET_ALIASES = {"people": "character"}
+BATCH_OPERATIONS = ("add", "remove")
+MAX_BATCH_SIZE = 1000
+UPSERT_DIALECTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+def bump_counts(target, target_ids, delta):
+    """Add `delta` (+1 or -1) to the favorite counters of `target_ids`."""
+    target_ids = sorted(target_ids)
+    if not target_ids:
+        return
+    if delta < 0:
+        FavoriteCount.query.filter(FavoriteCount.kind == target, FavoriteCount.target_id.in_(target_ids),
+                                   FavoriteCount.count > 0).update(
+            {FavoriteCount.count: FavoriteCount.count + delta}, synchronize_session=False)
+        return
+    insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if insert is None:
+        existing = {value for (value,) in db.session.query(FavoriteCount.target_id).filter(
+            FavoriteCount.kind == target, FavoriteCount.target_id.in_(target_ids))}
+        if existing:
+            FavoriteCount.query.filter(FavoriteCount.kind == target, FavoriteCount.target_id.in_(existing)).update(
+                {FavoriteCount.count: FavoriteCount.count + delta}, synchronize_session=False)
+        rows = [{"kind": target, "target_id": target_id, "count": delta}
+                for target_id in target_ids if target_id not in existing]
+        if rows:
+            db.session.execute(generic_insert(FavoriteCount), rows)
+        return
+    statement = insert(FavoriteCount).values([{"kind": target, "target_id": target_id, "count": delta}
+                                              for target_id in target_ids])
+    statement = statement.on_conflict_do_update(
+        index_elements=[FavoriteCount.kind, FavoriteCount.target_id],
+        set_={"count": FavoriteCount.count + statement.excluded["count"]},
+    )
+    db.session.execute(statement)
+
+def add_favorite(user_id, target, target_id):
+    """Insert the favorite unless it already exists. Returns True when a row was added.
+
+    The caller owns the transaction and must commit.
+    """
+    column = TARGET_COLUMNS[target]
+    values = {"user_fk": user_id, column.key: target_id}
+    insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if insert is None:
+        if Favorites.query.filter_by(**values).first() is not None:
+            return False
+        db.session.add(Favorites(**values))
+        db.session.flush()
+        bump_counts(target, [target_id], 1)
+        queue_favorite_event(db.session, user_id, "add", target, target_id)
+        return True
+    statement = insert(Favorites).values(**values).on_conflict_do_nothing(
+        index_elements=[Favorites.user_fk, column],
+        index_where=column.isnot(None),
+    )
+    created = db.session.execute(statement).rowcount == 1
+    if created:
+        bump_counts(target, [target_id], 1)
+        queue_favorite_event(db.session, user_id, "add", target, target_id)
+    return created
+
+def remove_favorite(user_id, target, target_id):
+    """Delete the favorite with one DELETE. Returns True when a row was removed."""
+    column = TARGET_COLUMNS[target]
+    deleted = Favorites.query.filter(Favorites.user_fk == user_id, column == target_id).delete(synchronize_session=False)
+    if deleted:
+        bump_counts(target, [target_id], -1)
+        queue_favorite_event(db.session, user_id, "remove", target, target_id)
+    return deleted > 0
+
+def _parse_operation(operation):
+    if not isinstance(operation, dict):
+        raise ValueError("se esperaba un objeto")
+    op = operation.get("op")
+    if op not in BATCH_OPERATIONS:
+        raise ValueError("'op' debe ser 'add' o 'remove'")
+    target = TARGET_ALIASES.get(operation.get("type"), operation.get("type"))
+    if target not in TARGET_COLUMNS:
+        raise ValueError("'type' debe ser planet, vehicle o people")
+    target_id = operation.get("id")
+    if not isinstance(target_id, int) or isinstance(target_id, bool):
+        raise ValueError("'id' debe ser un entero")
+    return op, target, target_id
+
+def _ids_in(column, ids):
+    return {value for (value,) in db.session.query(column).filter(column.in_(ids))} if ids else set()
+
+def _insert_favorites(target, rows):
+    """Insert `rows`, returning the target ids that were actually inserted.
+
+    A concurrent request may have added some of them since they were read; those
+    hit ON CONFLICT DO NOTHING and RETURNING leaves them out.
+    """
+    column = TARGET_COLUMNS[target]
+    dialect = db.session.get_bind().dialect
+    insert = UPSERT_DIALECTS.get(dialect.name)
+    if insert is None:
+        db.session.execute(generic_insert(Favorites), rows)
+        return {row[column.key] for row in rows}
+    statement = insert(Favorites).values(rows).on_conflict_do_nothing(
+        index_elements=[Favorites.user_fk, column],
+        index_where=column.isnot(None),
+    )
+    if not dialect.insert_returning:
+        db.session.execute(statement)
+        return {row[column.key] for row in rows}
+    return {value for (value,) in db.session.execute(statement.returning(column))}
+
+def _delete_favorites(user_id, target, target_ids):
+    # Returns the target ids whose favorite was actually deleted (see _insert_favorites).
+    column = TARGET_COLUMNS[target]
+    statement = delete(Favorites).where(Favorites.user_fk == user_id, column.in_(target_ids)).execution_options(
+        synchronize_session=False)
+    if not db.session.get_bind().dialect.delete_returning:
+        db.session.execute(statement)
+        return set(target_ids)
+    return {value for (value,) in db.session.execute(statement.returning(column))}
+
+def _settle_results(results, target, status, planned, written, lost_status):
+    # Operations whose write turned out to be a no-op report what they found instead.
+    for result in results:
+        if result.get("type") == target and result.get("status") == status and result["id"] in planned - written:
+            result["status"] = lost_status
+
+def apply_batch(user_id, operations):
+    """Apply add/remove operations for one user, returning a result per operation.
+
+    Operations are replayed in order against the user's current favorites, read with
+    one query per target type, so repeated or contradicting operations resolve like
+    sequential calls would. Only the net difference is written: at most one INSERT
+    and one DELETE per target type, plus their counter updates. Adds of entities that do not exist are reported
+    as "missing" and not written. The caller owns the transaction and must commit.
+    """
+    if not isinstance(operations, list):
+        raise APIException("Se esperaba una lista de operaciones", status_code=400)
+    if len(operations) > MAX_BATCH_SIZE:
+        raise APIException("Maximo %d operaciones por lote" % MAX_BATCH_SIZE, status_code=400)
+    if db.session.get(User, user_id) is None:
+        raise APIException("Usuario no existe!", status_code=404)
+
+    parsed = []
+    results = []
+    for index, operation in enumerate(operations):
+        try:
+            parsed.append((index,) + _parse_operation(operation))
+            results.append(None)
+        except ValueError as error:
+            results.append({"index": index, "status": "invalid", "error": str(error)})
+
+    requested = {target: set() for target in TARGET_COLUMNS}
+    for index, op, target, target_id in parsed:
+        requested[target].add(target_id)
+    current = {}
+    existing = {}
+    for target, ids in requested.items():
+        column = TARGET_COLUMNS[target]
+        favorites = db.session.query(column).filter(Favorites.user_fk == user_id, column.in_(ids)) if ids else ()
+        current[target] = {value for (value,) in favorites}
+        existing[target] = _ids_in(TARGET_MODELS[target].id, ids)
+    initial = {target: set(ids) for target, ids in current.items()}
+
+    for index, op, target, target_id in parsed:
+        favorites = current[target]
+        if op == "add":
+            if target_id not in existing[target]:
+                status = "missing"
+            elif target_id in favorites:
+                status = "exists"
+            else:
+                favorites.add(target_id)
+                status = "added"
+        elif target_id in favorites:
+            favorites.discard(target_id)
+            status = "removed"
+        else:
+            status = "missing"
+        results[index] = {"index": index, "op": op, "type": target, "id": target_id, "status": status}
+
+    added = removed = 0
+    for target, column in TARGET_COLUMNS.items():
+        to_add = current[target] - initial[target]
+        to_remove = initial[target] - current[target]
+        # Counters, events and statuses follow the rows actually written, which can be
+        # fewer than planned when another request wrote the same favorites meanwhile.
+        if to_add:
+            inserted = _insert_favorites(target, [{"user_fk": user_id, "planet_fk": None, "vehicle_fk": None,
+                                                   "character_fk": None, column.key: target_id}
+                                                  for target_id in sorted(to_add)])
+            bump_counts(target, inserted, 1)
+            for target_id in sorted(inserted):
+                queue_favorite_event(db.session, user_id, "add", target, target_id)
+            _settle_results(results, target, "added", to_add, inserted, "exists")
+            added += len(inserted)
+        if to_remove:
+            deleted = _delete_favorites(user_id, target, sorted(to_remove))
+            bump_counts(target, deleted, -1)
+            for target_id in sorted(deleted):
+                queue_favorite_event(db.session, user_id, "remove", target, target_id)
+            _settle_results(results, target, "removed", to_remove, deleted, "missing")
+            removed += len(deleted)
+    return {"added": added, "removed": removed, "results": results}
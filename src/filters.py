@@ -0,0 +1,121 @@
+"""
+Whitelisted filter and sort grammar for the list routes
+
+    /people?gender=female&min_height=170&sort=-mass
+    /planets?climate=arid&min_population=1000000
+    /vehicles?manufacturer=Incom%20Corporation&max_length=20&sort=length
+
+Equality filters use `<field>=value`, range filters `min_<field>`/`max_<field>`,
+and `sort` takes one field, prefixed with `-` for descending order. Every filter
+and sort column is backed by a B-tree index.
+"""
+import json
+import base64
+from models import Character, Planet, Vehicle
+from utils import APIException, keyset_paginate, parse_limit
+
+# Query parameters used by the list routes themselves
+RESERVED_ARGS = {"limit", "after", "stream", "fields", "ids", "sort"}
+
+FILTERS = {
+    Character: {
+        "equal": {"gender": Character.gender},
+        "range": {"height": Character.height, "mass": Character.mass},
+        "sort": {"name": Character.name, "height": Character.height, "mass": Character.mass},
+    },
+    Planet: {
+        "equal": {"climate": Planet.climate},
+        "range": {"population": Planet.population, "diameter": Planet.diameter_value, "gravity": Planet.gravity_value},
+        "sort": {"name": Planet.name, "population": Planet.population, "diameter": Planet.diameter_value,
+                 "gravity": Planet.gravity_value},
+    },
+    Vehicle: {
+        "equal": {"manufacturer": Vehicle.manufacturer, "vehicle_class": Vehicle.vehicle_class},
+        "range": {"length": Vehicle.length_value},
+        "sort": {"name": Vehicle.name, "length": Vehicle.length_value},
+    },
+}
+
+def _number(name, value):
+    try:
+        return float(value)
+    except ValueError:
+        raise APIException("'%s' debe ser numerico" % name, status_code=400)
+
+def apply_filters(query, model, args):
+    spec = FILTERS.get(model, {"equal": {}, "range": {}})
+    for name, value in args.items():
+        if name in RESERVED_ARGS:
+            continue
+        if name in spec["equal"]:
+            query = query.filter(spec["equal"][name] == value)
+        elif name.startswith("min_") and name[4:] in spec["range"]:
+            query = query.filter(spec["range"][name[4:]] >= _number(name, value))
+        elif name.startswith("max_") and name[4:] in spec["range"]:
+            query = query.filter(spec["range"][name[4:]] <= _number(name, value))
+        else:
+            allowed = sorted(spec["equal"]) + ["min_" + field for field in sorted(spec["range"])] + \
+                ["max_" + field for field in sorted(spec["range"])]
+            raise APIException("Filtro desconocido: %s" % name, status_code=400, payload={"allowed": allowed})
+    return query
+
+def parse_sort(model, args):
+    # "-mass" -> (Character.mass, True); None when no sort was requested
+    value = args.get("sort")
+    if not value:
+        return None
+    descending = value.startswith("-")
+    name = value.lstrip("-")
+    sorts = FILTERS.get(model, {}).get("sort", {})
+    if name not in sorts:
+        raise APIException("Orden desconocido: %s" % name, status_code=400, payload={"allowed": sorted(sorts)})
+    return sorts[name], descending
+
+def apply_sort(query, model, args):
+    sort = parse_sort(model, args)
+    if sort is None:
+        return query
+    column, descending = sort
+    return query.order_by(column.desc().nulls_last() if descending else column.asc().nulls_last())
+
+def _encode_cursor(value, entity_id):
+    return base64.urlsafe_b64encode(json.dumps([value, entity_id]).encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        value, entity_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(entity_id)
+    except (ValueError, TypeError):
+        raise APIException("Cursor invalido", status_code=400)
+
+def sorted_paginate(query, model, args, sort):
+    """Keyset pagination over (sort column, id) with NULLs last.
+
+    The `next` cursor is an opaque token holding the last row's sort value and id.
+    """
+    column, descending = sort
+    limit = parse_limit(args)
+    if args.get("after"):
+        value, last_id = _decode_cursor(args["after"])
+        if value is None:
+            query = query.filter(column.is_(None), model.id > last_id)
+        else:
+            beyond = column < value if descending else column > value
+            query = query.filter(beyond | ((column == value) & (model.id > last_id)) | column.is_(None))
+    order = column.desc().nulls_last() if descending else column.asc().nulls_last()
+    # The sort value is appended as a trailing column so the cursor can be built even
+    # when ?fields= left it out; row serializers zip by name and ignore it.
+    query = query.add_columns(column.label("sort_value"))
+    rows = query.order_by(order, model.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = _encode_cursor(last.sort_value, last.id)
+    return rows[:limit], next_cursor
+
+def paginate(query, model, args):
+    query = apply_filters(query, model, args)
+    sort = parse_sort(model, args)
+    if sort is None:
+        return keyset_paginate(query, model, args)
+    return sorted_paginate(query, model, args, sort)
@@ -0,0 +1,61 @@
+"""
+Prometheus metrics: per-route latency histograms, request/error counters,
+response size summaries and in-flight gauges, served at /metrics
+
+Under gunicorn, gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a shared
+directory so every worker writes its samples there and one scrape of /metrics
+aggregates the whole instance.
+"""
+import os
+import time
+from flask import g, request, Response
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, Summary, CONTENT_TYPE_LATEST,
+    REGISTRY, generate_latest, multiprocess)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Request latency by route",
+                            ["endpoint", "method"], buckets=LATENCY_BUCKETS)
+REQUESTS = Counter("http_requests_total", "Requests by route and status", ["endpoint", "method", "status"])
+ERRORS = Counter("http_request_errors_total", "Responses with a 5xx status by route", ["endpoint", "method"])
+RESPONSE_SIZE = Summary("http_response_size_bytes", "Response body size by route", ["endpoint", "method"])
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served", multiprocess_mode="livesum")
+
+def _endpoint():
+    # Route names keep label cardinality bounded; unmatched URLs share one label.
+    return request.endpoint or "unmatched"
+
+def setup_metrics(app):
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_request(response):
+        if "metrics_start" not in g:
+            return response
+        endpoint, method = _endpoint(), request.method
+        REQUEST_LATENCY.labels(endpoint, method).observe(time.perf_counter() - g.metrics_start)
+        REQUESTS.labels(endpoint, method, str(response.status_code)).inc()
+        if response.status_code >= 500:
+            ERRORS.labels(endpoint, method).inc()
+        # Streamed responses have no length up front and are left out of the summary.
+        if response.content_length is not None:
+            RESPONSE_SIZE.labels(endpoint, method).observe(response.content_length)
+        return response
+
+    @app.teardown_request
+    def end_in_flight(error=None):
+        if g.pop("metrics_start", None) is not None:
+            IN_FLIGHT.dec()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -1,9 +1,34 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-
-db = SQLAlchemy()
-
-class User(db.Model):
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from serializers import Serializable
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+class numeric_prefix(FunctionElement):
+    """Leading number of a free-text column: "1.5 (surface)" -> 1.5, "1,200" -> 1200,
+    "unknown" -> NULL. Used for generated columns that range filters can index."""
+    type = db.Float()
+    name = "numeric_prefix"
+    inherit_cache = True
+
+@compiles(numeric_prefix)
+def _numeric_prefix_default(element, compiler, **kw):
+    return "CAST(%s AS FLOAT)" % compiler.process(element.clauses, **kw)
+
+@compiles(numeric_prefix, "sqlite")
+def _numeric_prefix_sqlite(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    return ("CASE WHEN trim({0}) GLOB '[0-9]*' THEN CAST(replace(trim({0}), ',', '') AS REAL) END").format(column)
+
+@compiles(numeric_prefix, "postgresql")
+def _numeric_prefix_postgresql(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    return ("CAST(replace(substring({0} from '^\\s*([0-9][0-9,]*(\\.[0-9]+)?)'), ',', '') AS double precision)").format(column)
+
+class User(Serializable, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(80), unique=False, nullable=False)
@@ -13,54 +38,32 @@ class User(db.Model):
     def __repr__(self):
         return '<User %r>' % self.email
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "email": self.email,
-            "password": self.password,
-            "is_active": self.is_active,
-            # do not serialize the password, its a security breach
-        }
-
-class Planet(db.Model):
+class Planet(Serializable, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
     url = db.Column(db.String, nullable=False, unique=True)
-    climate = db.Column(db.String, nullable=False)
+    climate = db.Column(db.String, nullable=False, index=True)
     created = db.Column(db.DateTime, nullable=False)
     diameter = db.Column(db.String, nullable=False)
     gravity = db.Column(db.String, nullable=False)
     orbital_period = db.Column(db.Integer, nullable=False)
-    population = db.Column(db.Integer, nullable=False)
+    population = db.Column(db.Integer, nullable=False, index=True)
     rotation_period = db.Column(db.Integer, nullable=False)
     surface_water = db.Column(db.Integer, nullable=False)
     terrain = db.Column(db.String, nullable=False)
-    edited = db.Column(db.DateTime, nullable=False)
+    edited = db.Column(db.DateTime, nullable=False, index=True, onupdate=datetime.utcnow)
+    # Stamped by the server on every insert and update, never taken from clients
+    # (unlike `edited`); the position of the row in GET /changes.
+    changed_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           info={"read_only": True})
+    diameter_value = db.Column(db.Float, db.Computed(numeric_prefix(diameter), persisted=True), index=True)
+    gravity_value = db.Column(db.Float, db.Computed(numeric_prefix(gravity), persisted=True), index=True)
     favorite = db.relationship("Favorites", backref="planet", lazy=True)
 
     def __repr__(self):
         return '<Planet %r>' % self.name
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "url": self.url,
-            "climate": self.climate,
-            "created": self.created,
-            "diameter": self.diameter,
-            "gravity": self.gravity,
-            "orbital_period": self.orbital_period,
-            "population": self.population,
-            "rotation_period": self.rotation_period,
-            "surface_water": self.surface_water,
-            "terrain": self.terrain,
-            "edited": self.edited
-            
-            # do not serialize the password, its a security breach
-        }
-
-class Vehicle(db.Model):
+class Vehicle(Serializable, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
     url = db.Column(db.String, nullable=False, unique=True)
@@ -68,88 +71,110 @@ class Vehicle(db.Model):
     created = db.Column(db.DateTime, nullable=False)
     crew = db.Column(db.Integer, nullable=False)
     length = db.Column(db.String, nullable=False)
-    manufacturer = db.Column(db.String, nullable=False)
+    manufacturer = db.Column(db.String, nullable=False, index=True)
     max_atmosphering_speed = db.Column(db.Integer, nullable=False)
     model = db.Column(db.String, nullable=False)
-    vehicle_class = db.Column(db.String, nullable=False)
-    edited = db.Column(db.DateTime, nullable=False)
+    vehicle_class = db.Column(db.String, nullable=False, index=True)
+    edited = db.Column(db.DateTime, nullable=False, index=True, onupdate=datetime.utcnow)
+    changed_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           info={"read_only": True})
+    length_value = db.Column(db.Float, db.Computed(numeric_prefix(length), persisted=True), index=True)
     favorite = db.relationship("Favorites", backref="vehicle", lazy=True)
 
 
     def __repr__(self):
         return '<Vehicle %r>' % self.name
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "url": self.url,
-            "cargo_capacity": self.cargo_capacity,
-            "created": self.created,
-            "crew": self.crew,
-            "manufacturer": self.manufacturer,
-            "max_atmosphering_speed": self.max_atmosphering_speed,
-            "model": self.model,
-            "vehicle_class": self.vehicle_class,
-            "edited": self.edited
-
-            # do not serialize the password, its a security breach
-        }
-class Character(db.Model):
+class Character(Serializable, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    name = db.Column(db.String, index=True)
     url = db.Column(db.String)
-    height = db.Column(db.Integer, nullable=False)
-    mass = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False, index=True)
+    mass = db.Column(db.Integer, nullable=False, index=True)
     hair_color = db.Column(db.String, nullable=False)
     skin_color = db.Column(db.String, nullable=False)
     eye_color = db.Column(db.String, nullable=False)
     birth_year = db.Column(db.String, nullable=False)
-    gender = db.Column(db.String, nullable=False)
+    gender = db.Column(db.String, nullable=False, index=True)
     homeworld = db.Column(db.String, nullable=False)
     created = db.Column(db.DateTime, nullable=False)
-    edited = db.Column(db.DateTime, nullable=False)
+    edited = db.Column(db.DateTime, nullable=False, index=True, onupdate=datetime.utcnow)
+    changed_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           info={"read_only": True})
     favorite = db.relationship("Favorites", backref="character", lazy=True)
     
     def __repr__(self):
         return '<Character %r>' % self.id
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "url": self.url,
-            "height": self.height,
-            "mass": self.mass,
-            "hair_color": self.hair_color,
-            "skin_color": self.skin_color,
-            "eye_color": self.eye_color,
-            "birth_year": self.birth_year,
-            "gender": self.gender,
-            "homeworld": self.homeworld,
-            "created": self.created,
-            "edited": self.edited
-            # do not serialize the password, its a security breach
-        }
-
-
-class Favorites(db.Model):
+
+class Favorites(Serializable, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_fk = db.Column(db.Integer, db.ForeignKey("user.id"))
+    user_fk = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
     planet_fk = db.Column(db.Integer, db.ForeignKey("planet.id"))
     vehicle_fk = db.Column(db.Integer, db.ForeignKey("vehicle.id"))
     character_fk = db.Column(db.Integer, db.ForeignKey("character.id"))
 
+    # One row per (user, target): partial unique indexes per target type, which also
+    # back the ON CONFLICT DO NOTHING upserts in favorites.py
+    __table_args__ = (
+        db.Index("uq_favorites_user_planet", "user_fk", "planet_fk", unique=True,
+                 postgresql_where=db.text("planet_fk IS NOT NULL"), sqlite_where=db.text("planet_fk IS NOT NULL")),
+        db.Index("uq_favorites_user_vehicle", "user_fk", "vehicle_fk", unique=True,
+                 postgresql_where=db.text("vehicle_fk IS NOT NULL"), sqlite_where=db.text("vehicle_fk IS NOT NULL")),
+        db.Index("uq_favorites_user_character", "user_fk", "character_fk", unique=True,
+                 postgresql_where=db.text("character_fk IS NOT NULL"), sqlite_where=db.text("character_fk IS NOT NULL")),
+    )
+
 
     def __repr__(self):
         return '<Favorites %r>' % self.id
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "user_fk": self.user_fk,
-            "planet_fk": self.planet_fk,
-            "vehicle_fk": self.vehicle_fk,
-            "character_fk": self.character_fk
-            # do not serialize the password, its a security breach
-        }
\ No newline at end of file
+    def serialize_expanded(self):
+        # Expects planet/vehicle/character to be eager loaded (see load_user_favorites)
+        result = self.serialize()
+        result["planet"] = self.planet.serialize() if self.planet else None
+        result["vehicle"] = self.vehicle.serialize() if self.vehicle else None
+        result["character"] = self.character.serialize() if self.character else None
+        return result
+
+class FavoriteCount(db.Model):
+    # How many users favorited each planet/vehicle/character, kept in step by the
+    # favorites write paths (see popularity.py). A separate table so that counting
+    # does not touch the catalog rows and their `edited` stamps.
+    __tablename__ = "favorite_counts"
+    kind = db.Column(db.String(10), primary_key=True)
+    target_id = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ix_favorite_counts_kind_count", "kind", "count", "target_id"),
+    )
+
+    def __repr__(self):
+        return '<FavoriteCount %s %r: %r>' % (self.kind, self.target_id, self.count)
+
+
+class Tombstone(db.Model):
+    # One row per deleted Character/Planet/Vehicle, written by AFTER DELETE triggers
+    # (migration b61d04e9c5a2) so admin and raw SQL deletes are recorded too.
+    # `id` is the feed position of the delete in GET /changes.
+    __tablename__ = "tombstones"
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<Tombstone %s %r>' % (self.kind, self.entity_id)
+
+
+class TableVersion(db.Model):
+    # Bumped by triggers on every write to Character/Planet/Vehicle (migration
+    # c48e2f1a9d37); the list ETags and Last-Modified are derived from it.
+    __tablename__ = "table_versions"
+    table_name = db.Column(db.String(30), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<TableVersion %s %r>' % (self.table_name, self.version)
@@ -0,0 +1,90 @@
+"""
+SQLAlchemy connection pool configuration from the environment, and pool metrics
+
+    DB_POOL_SIZE          connections kept open per worker (default 5)
+    DB_MAX_OVERFLOW       extra connections allowed under bursts (default 10)
+    DB_POOL_TIMEOUT       seconds to wait for a connection before failing (default 30)
+    DB_POOL_RECYCLE       seconds after which a connection is replaced (default 1800)
+    DB_POOL_PRE_PING      test connections on checkout, "0" to disable (default 1)
+"""
+import os
+import time
+import threading
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+class PoolWaitStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += int(timed_out)
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_total, 6),
+                "wait_seconds_max": round(self.wait_max, 6),
+                "wait_seconds_avg": round(self.wait_total / self.checkouts, 6) if self.checkouts else 0.0
+            }
+
+wait_stats = PoolWaitStats()
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection,
+    including time spent opening a new one."""
+    wait_stats = wait_stats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return record
+
+def timed_pool_class(stats):
+    # A TimedQueuePool recording into `stats` instead of the primary's wait_stats.
+    # A subclass rather than an attribute, so pools recreated on invalidation keep it.
+    return type("TimedQueuePool", (TimedQueuePool,), {"wait_stats": stats})
+
+def _flag(value):
+    return value.lower() not in ("0", "false", "no", "off")
+
+def engine_options_from_env(environ=os.environ):
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": _flag(environ.get("DB_POOL_PRE_PING", "1")),
+    }
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {
+        "pid": os.getpid(),
+        "pool_class": type(pool).__name__,
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    stats.update(getattr(pool, "wait_stats", wait_stats).to_dict())
+    return stats
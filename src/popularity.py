@@ -0,0 +1,43 @@
+"""
+Most-favorited planets, characters and vehicles, read from favorite_counts
+
+The counters are kept in step by favorites.py. Writes that bypass it (Flask-Admin,
+raw SQL) can make them drift; `flask reconcile-popularity` rebuilds them.
+"""
+from sqlalchemy import func, insert, literal, select
+from models import db, FavoriteCount, Planet, Vehicle, Character
+from favorites import TARGET_COLUMNS
+from serializers import column_names, row_serializer
+from utils import MAX_PAGE_SIZE, parse_int_arg
+
+POPULAR_KINDS = {
+    Planet: "planet",
+    Vehicle: "vehicle",
+    Character: "character",
+}
+POPULAR_DEFAULT_LIMIT = 10
+
+def popular(model, args):
+    """Top entities by favorite count, each serialized with a "favorites" field.
+
+    Walks ix_favorite_counts_kind_count backwards, so only `limit` counters are read.
+    """
+    limit = min(parse_int_arg(args, "limit", POPULAR_DEFAULT_LIMIT, minimum=1), MAX_PAGE_SIZE)
+    names = column_names(model)
+    query = db.session.query(*(getattr(model, name) for name in names), FavoriteCount.count).select_from(
+        FavoriteCount).join(model, model.id == FavoriteCount.target_id).filter(
+        FavoriteCount.kind == POPULAR_KINDS[model], FavoriteCount.count > 0).order_by(
+        FavoriteCount.count.desc(), FavoriteCount.target_id.desc()).limit(limit)
+    serialize = row_serializer(names + ("favorites",))
+    return [serialize(row) for row in query]
+
+def rebuild_counts():
+    """Recompute every counter from favorites with one GROUP BY per target type."""
+    db.session.query(FavoriteCount).delete(synchronize_session=False)
+    rebuilt = {}
+    for kind, column in TARGET_COLUMNS.items():
+        grouped = select(literal(kind), column, func.count()).where(column.isnot(None)).group_by(column)
+        db.session.execute(insert(FavoriteCount).from_select(["kind", "target_id", "count"], grouped))
+        rebuilt[kind] = db.session.query(FavoriteCount).filter(FavoriteCount.kind == kind).count()
+    db.session.commit()
+    return rebuilt
@@ -0,0 +1,53 @@
+"""
+Opt-in per-request SQL profiling with N+1 detection
+
+    SQL_PROFILE=1                   enable (listeners are not registered otherwise)
+    SQL_PROFILE_REPEAT_THRESHOLD=10 warn when one statement shape runs more often
+                                    than this within a single request
+
+Adds X-Query-Count and X-DB-Time (milliseconds) headers to every response.
+"""
+import os
+import re
+import time
+from collections import Counter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+IN_LIST = re.compile(r"IN \((?:[^()]|\([^()]*\))*\)")
+
+def statement_shape(statement):
+    # Expanded IN lists differ only by their length, so collapse them.
+    return IN_LIST.sub("IN (...)", " ".join(statement.split()))
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or not conn.info.get("query_start"):
+        return
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    profile = g.setdefault("sql_profile", {"count": 0, "time": 0.0, "shapes": Counter()})
+    profile["count"] += 1
+    profile["time"] += elapsed
+    profile["shapes"][statement_shape(statement)] += 1
+
+def setup_profiling(app):
+    if os.getenv("SQL_PROFILE", "0") in ("0", "", "false"):
+        return
+    threshold = int(os.getenv("SQL_PROFILE_REPEAT_THRESHOLD", 10))
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.after_request
+    def add_profile_headers(response):
+        profile = g.get("sql_profile", {"count": 0, "time": 0.0, "shapes": Counter()})
+        response.headers["X-Query-Count"] = str(profile["count"])
+        response.headers["X-DB-Time"] = "%.3f" % (profile["time"] * 1000)
+        for shape, count in profile["shapes"].items():
+            if count > threshold:
+                app.logger.warning("Posible N+1 en %s %s: %d ejecuciones de %s",
+                                   request.method, request.path, count, shape[:200])
+        return response
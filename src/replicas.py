@@ -0,0 +1,141 @@
+"""
+Read-replica routing for safe (GET/HEAD) requests
+
+    DATABASE_URL_READ          comma separated replica URLs; unset = primary only
+    DB_REPLICA_CHECK_INTERVAL  seconds between health checks per replica (default 5)
+    DB_REPLICA_STICKY_SECONDS  how long a client reads from the primary after a
+                               write, so it sees its own changes (default 5)
+
+Statements issued while serving a GET/HEAD go to a healthy replica, picked round
+robin once per session: every read of a request sees the same replica, so list
+validators and the body describe one snapshot. Flushes, INSERT/UPDATE/DELETE and
+everything after the first write in a session stay on the primary. So do all
+requests from a client that wrote within the sticky window (tracked with a
+cookie) or that sends `X-Read-Primary: 1`. A replica is re-checked with
+`SELECT 1` at most once per interval and is skipped while unhealthy. A
+disconnect error marks it unhealthy at once. With no healthy replica, reads
+fall back to the primary.
+"""
+import os
+import time
+import threading
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.sql.dml import UpdateBase
+from pool import PoolWaitStats, TimedQueuePool, timed_pool_class, pool_stats
+
+SAFE_METHODS = ("GET", "HEAD")
+STICKY_COOKIE = "read_primary"
+
+class Replica:
+    def __init__(self, url, engine_options):
+        self.url = url
+        engine_options = dict(engine_options)
+        if engine_options.get("poolclass") is TimedQueuePool:
+            # Own wait stats, so /pool/stats does not count replica waits as primary ones.
+            engine_options["poolclass"] = timed_pool_class(PoolWaitStats())
+        self.engine = create_engine(url.replace("postgres://", "postgresql://"), **engine_options)
+        self.healthy = True
+        self.checked_at = 0.0
+        self.failures = 0
+        event.listen(self.engine, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect:
+            self.mark_unhealthy()
+
+    def mark_unhealthy(self):
+        self.healthy = False
+        self.checked_at = time.monotonic()
+        self.failures += 1
+
+    def check(self):
+        try:
+            with self.engine.connect() as connection:
+                connection.exec_driver_sql("SELECT 1")
+        except exc.SQLAlchemyError:
+            self.mark_unhealthy()
+            return False
+        self.healthy = True
+        self.checked_at = time.monotonic()
+        return True
+
+    def to_dict(self):
+        return {
+            "url": self.engine.url.render_as_string(hide_password=True),
+            "healthy": self.healthy,
+            "failures": self.failures,
+            "pool": pool_stats(self.engine)
+        }
+
+class ReplicaRouter:
+    def __init__(self, urls, engine_options, check_interval=5.0):
+        self.replicas = [Replica(url, engine_options) for url in urls]
+        self.check_interval = check_interval
+        self.fallbacks = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def pick(self):
+        """Engine of the next healthy replica, or None to use the primary."""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        now = time.monotonic()
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if now - replica.checked_at >= self.check_interval:
+                replica.check()
+            if replica.healthy:
+                return replica.engine
+        self.fallbacks += 1
+        return None
+
+    def stats(self):
+        return {
+            "replicas": [replica.to_dict() for replica in self.replicas],
+            "fallbacks_to_primary": self.fallbacks
+        }
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends the reads of replica-eligible requests
+    to a replica. Writes, and all reads after them, stay on the primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            # Pinned until the session is removed at the end of the request. A
+            # fallback to the primary (None) is pinned as well.
+            if "replica" not in self.info:
+                self.info["replica"] = current_app.extensions["replicas"].pick()
+            if self.info["replica"] is not None:
+                return self.info["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+        if self.info.get("wrote") or not has_app_context() or not g.get("read_replica"):
+            return False
+        return "replicas" in current_app.extensions
+
+def setup_replicas(app, engine_options, environ=os.environ):
+    urls = [url.strip() for url in environ.get("DATABASE_URL_READ", "").split(",") if url.strip()]
+    if not urls:
+        return None
+    router = ReplicaRouter(urls, engine_options, float(environ.get("DB_REPLICA_CHECK_INTERVAL", 5)))
+    app.extensions["replicas"] = router
+    sticky_seconds = int(environ.get("DB_REPLICA_STICKY_SECONDS", 5))
+
+    @app.before_request
+    def route_reads():
+        g.read_replica = (request.method in SAFE_METHODS and STICKY_COOKIE not in request.cookies
+                          and request.headers.get("X-Read-Primary") != "1")
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, "1", max_age=sticky_seconds, httponly=True)
+        return response
+
+    return router
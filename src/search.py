@@ -0,0 +1,112 @@
+"""
+Full-text search across characters, planets and vehicles
+
+SQLite uses the FTS5 `search_index` table and Postgres the generated
+`search_vector` columns, both created by migration a52c9d1e08f3.
+"""
+from contextlib import contextmanager
+from sqlalchemy import text
+from models import db, Character, Planet, Vehicle
+from cache import cached_details
+
+# kind -> (model, code used in the SQLite rowid)
+SEARCH_KINDS = {
+    "character": (Character, 1),
+    "planet": (Planet, 2),
+    "vehicle": (Vehicle, 3),
+}
+KIND_BY_CODE = {code: kind for kind, (_, code) in SEARCH_KINDS.items()}
+# table -> (kind code, indexed body expression); mirrors migration a52c9d1e08f3
+SQLITE_DOCUMENTS = {
+    "character": (1, "''"),
+    "planet": (2, "coalesce(climate, '') || ' ' || coalesce(terrain, '')"),
+    "vehicle": (3, "coalesce(model, '') || ' ' || coalesce(manufacturer, '')"),
+}
+
+SQLITE_SEARCH = text(
+    "SELECT rowid, -bm25(search_index, 10.0, 1.0) AS score FROM search_index "
+    "WHERE search_index MATCH :q ORDER BY score DESC, rowid LIMIT :limit OFFSET :offset"
+)
+POSTGRES_SEARCH = text(
+    "SELECT kind, entity_id, score FROM ("
+    " SELECT 'character' AS kind, id AS entity_id, ts_rank(search_vector, query) AS score"
+    "  FROM \"character\", plainto_tsquery('simple', :q) query WHERE search_vector @@ query"
+    " UNION ALL"
+    " SELECT 'planet', id, ts_rank(search_vector, query)"
+    "  FROM planet, plainto_tsquery('simple', :q) query WHERE search_vector @@ query"
+    " UNION ALL"
+    " SELECT 'vehicle', id, ts_rank(search_vector, query)"
+    "  FROM vehicle, plainto_tsquery('simple', :q) query WHERE search_vector @@ query"
+    ") hits ORDER BY score DESC, kind, entity_id LIMIT :limit OFFSET :offset"
+)
+
+def fts5_query(q):
+    # Every term is quoted so user input can't inject FTS5 syntax; a trailing *
+    # makes each term a prefix match ("tato" finds Tatooine).
+    terms = ['"%s"*' % term.replace('"', '""') for term in q.split()]
+    return " ".join(terms)
+
+def _hits(q, limit, offset):
+    if db.session.get_bind().dialect.name == "postgresql":
+        rows = db.session.execute(POSTGRES_SEARCH, {"q": q, "limit": limit, "offset": offset})
+        return [(kind, entity_id, float(score)) for kind, entity_id, score in rows]
+    rows = db.session.execute(SQLITE_SEARCH, {"q": fts5_query(q), "limit": limit, "offset": offset})
+    return [(KIND_BY_CODE[rowid % 4], rowid // 4, score) for rowid, score in rows]
+
+def search(q, limit, offset):
+    """Ranked matches for `q` as (results, next offset or None).
+
+    Hits are resolved per kind with one cached multi-get each, so a page costs
+    at most four queries regardless of its size.
+    """
+    hits = _hits(q, limit + 1, offset)
+    next_offset = offset + limit if len(hits) > limit else None
+    hits = hits[:limit]
+    entities = {}
+    for kind, (model, _) in SEARCH_KINDS.items():
+        ids = [entity_id for hit_kind, entity_id, _ in hits if hit_kind == kind]
+        if ids:
+            found, _ = cached_details(model, ids)
+            entities.update(((kind, item["id"]), item) for item in found)
+    results = [
+        {"type": kind, "score": score, "result": entities[(kind, entity_id)]}
+        for kind, entity_id, score in hits if (kind, entity_id) in entities
+    ]
+    return results, next_offset
+
+@contextmanager
+def deferred_search_index(connection, table_name, first_id):
+    """Bulk loads on SQLite: swap the per-row FTS insert trigger of `table_name` for
+    one INSERT ... SELECT over the rows with id >= first_id once the block is done.
+
+    Everything happens inside the caller's transaction, so a failed load rolls the
+    trigger back too. Other backends and tables without the trigger are untouched.
+    """
+    trigger = "%s_search_ai" % table_name
+    trigger_sql = None
+    if connection.dialect.name == "sqlite" and table_name in SQLITE_DOCUMENTS:
+        trigger_sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (trigger,)).scalar()
+    if trigger_sql is None:
+        yield
+        return
+    # pysqlite only opens its implicit transaction on DML; this no-op makes sure the
+    # DROP TRIGGER below is part of it rather than autocommitted.
+    connection.exec_driver_sql("DELETE FROM search_index WHERE rowid < 0")
+    connection.exec_driver_sql("DROP TRIGGER %s" % trigger)
+    yield
+    code, body = SQLITE_DOCUMENTS[table_name]
+    connection.exec_driver_sql(
+        'INSERT INTO search_index(rowid, name, body) SELECT id * 4 + %d, coalesce(name, \'\'), %s FROM "%s" WHERE id >= ?'
+        % (code, body, table_name), (first_id,))
+    connection.exec_driver_sql(trigger_sql)
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # Keep autogenerate from dropping the search objects, which have no model.
+    if type_ == "table" and name.startswith("search_index"):
+        return False
+    if type_ == "column" and name == "search_vector":
+        return False
+    if type_ == "index" and name.endswith("_search_vector"):
+        return False
+    return True
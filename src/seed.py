@@ -0,0 +1,192 @@
+"""
+Deterministic synthetic data for User, Character, Planet, Vehicle and Favorites
+
+Rows are generated as tuples from a seeded RNG, streamed in batches and written
+with the fastest path of each backend: COPY on Postgres (psycopg2), a raw DBAPI
+executemany on SQLite and SQLAlchemy executemany anywhere else. Everything is
+committed once at the end.
+"""
+import io
+import csv
+import random
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import func, insert
+from models import db, User, Character, Planet, Vehicle, Favorites
+from search import deferred_search_index
+from conditional import deferred_version_bump
+from popularity import rebuild_counts
+
+CREATED = "2014-12-09 13:50:51.644000"
+EDITED = "2014-12-20 21:17:56.891000"
+
+HAIR_COLORS = ("blond", "brown", "black", "auburn, white", "grey", "none", "n/a")
+SKIN_COLORS = ("fair", "gold", "white, blue", "light", "green", "metal", "dark")
+EYE_COLORS = ("blue", "yellow", "red", "brown", "blue-gray", "black", "orange")
+GENDERS = ("male", "female", "n/a", "hermaphrodite")
+CLIMATES = ("arid", "temperate", "tropical", "frozen", "murky", "temperate, tropical")
+TERRAINS = ("desert", "grasslands, mountains", "jungle, rainforests", "tundra, ice caves", "swamp", "ocean")
+GRAVITIES = ("1 standard", "0.9 standard", "1.1 standard", "1.5 (surface), 1 standard (Cliffs)", "N/A", "unknown")
+MANUFACTURERS = ("Corellia Mining Corporation", "Incom Corporation", "Sienar Fleet Systems", "Kuat Drive Yards",
+                 "Aratech Repulsor Company", "SoroSuub Corporation")
+VEHICLE_CLASSES = ("wheeled", "repulsorcraft", "starfighter", "airspeeder", "walker", "speeder")
+
+def user_rows(rng, start, count):
+    for i in range(start, start + count):
+        yield ("user%d@example.com" % i, "secret%d" % i, True)
+
+def character_rows(rng, start, count):
+    randrange = rng.randrange
+    for i in range(start, start + count):
+        yield ("Character %d" % i, "https://swapi.dev/api/people/%d/" % i, 60 + randrange(200), 15 + randrange(1400),
+               HAIR_COLORS[i % 7], SKIN_COLORS[(i // 7) % 7], EYE_COLORS[randrange(7)], "%dBBY" % randrange(900),
+               GENDERS[randrange(4)], "https://swapi.dev/api/planets/%d/" % (1 + randrange(60)), CREATED, EDITED)
+
+def planet_rows(rng, start, count):
+    randrange = rng.randrange
+    for i in range(start, start + count):
+        yield ("Planet %d" % i, "https://swapi.dev/api/planets/%d/" % i, CLIMATES[randrange(6)], CREATED,
+               str(randrange(200000)), GRAVITIES[randrange(6)], randrange(5000), randrange(10 ** 9), randrange(100),
+               randrange(100), TERRAINS[randrange(6)], EDITED)
+
+def vehicle_rows(rng, start, count):
+    randrange = rng.randrange
+    for i in range(start, start + count):
+        yield ("Vehicle %d" % i, "https://swapi.dev/api/vehicles/%d/" % i, randrange(10 ** 6), CREATED,
+               1 + randrange(50), "%d.%d" % (1 + randrange(500), randrange(10)), MANUFACTURERS[randrange(6)],
+               100 + randrange(1900), "Model %d" % randrange(200), VEHICLE_CLASSES[randrange(6)], EDITED)
+
+# table -> (insert column order, row generator)
+GENERATORS = (
+    (User, ("email", "password", "is_active"), user_rows),
+    (Character, ("name", "url", "height", "mass", "hair_color", "skin_color", "eye_color", "birth_year", "gender",
+                 "homeworld", "created", "edited"), character_rows),
+    (Planet, ("name", "url", "climate", "created", "diameter", "gravity", "orbital_period", "population",
+              "rotation_period", "surface_water", "terrain", "edited"), planet_rows),
+    (Vehicle, ("name", "url", "cargo_capacity", "created", "crew", "length", "manufacturer",
+               "max_atmosphering_speed", "model", "vehicle_class", "edited"), vehicle_rows),
+)
+FAVORITE_COLUMNS = ("user_fk", "planet_fk", "vehicle_fk", "character_fk")
+
+def favorite_rows(rng, count, users, planets, vehicles, characters, skew, existing=()):
+    """Favorites whose users follow a Zipf-like law: user k gets weight 1 / k**skew.
+
+    skew=0 spreads favorites evenly, skew>=1 concentrates them on a few hot users.
+    (user, target) pairs are unique, matching the partial unique indexes; draws that
+    collide are retried a bounded number of times, so the count may fall short when
+    the catalog is too small for the requested volume.
+    """
+    if not users or count <= 0:
+        return
+    targets = [(slot, total) for slot, total in ((1, planets), (2, vehicles), (3, characters)) if total]
+    if not targets:
+        return
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, users + 1):
+        total += 1.0 / rank ** skew
+        cum_weights.append(total)
+    # Shuffle which ids are hot so they aren't always the lowest ones.
+    user_ids = list(range(1, users + 1))
+    rng.shuffle(user_ids)
+    seen = set(existing)
+    produced = 0
+    attempts = 0
+    max_attempts = count * 4
+    while produced < count and attempts < max_attempts:
+        batch = min(10000, count - produced)
+        for rank in rng.choices(range(users), cum_weights=cum_weights, k=batch):
+            attempts += 1
+            slot, total_targets = targets[attempts % len(targets)]
+            key = (user_ids[rank], slot, 1 + rng.randrange(total_targets))
+            if key in seen:
+                continue
+            seen.add(key)
+            row = [key[0], None, None, None]
+            row[key[1]] = key[2]
+            yield tuple(row)
+            produced += 1
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def write_rows(table, columns, rows, batch_size=10000):
+    """Stream `rows` (tuples in `columns` order) into `table`, returning the count."""
+    connection = db.session.connection()
+    dialect = connection.dialect
+    written = 0
+    if dialect.name == "postgresql" and dialect.driver == "psycopg2":
+        cursor = connection.connection.cursor()
+        statement = "COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (
+            dialect.identifier_preparer.format_table(table), ", ".join(columns))
+        for batch in _batches(rows, batch_size):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch)
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            written += len(batch)
+        return written
+    if dialect.name == "sqlite":
+        cursor = connection.connection.cursor()
+        statement = 'INSERT INTO "%s" (%s) VALUES (%s)' % (table.name, ", ".join(columns), ", ".join("?" * len(columns)))
+        for batch in _batches(rows, batch_size):
+            cursor.executemany(statement, batch)
+            written += len(batch)
+        return written
+    statement = insert(table)
+    for batch in _batches(rows, batch_size):
+        connection.execute(statement, [dict(zip(columns, row)) for row in batch])
+        written += len(batch)
+    return written
+
+def _max_id(model):
+    return db.session.query(func.coalesce(func.max(model.id), 0)).scalar()
+
+def seed_database(counts, seed=42, skew=1.0, batch_size=10000):
+    """Append `counts` ({"users": n, "characters": n, ...}) synthetic rows.
+
+    New rows get names and emails past the current max id, so seeding twice never
+    breaks a unique constraint. Returns {table name: rows written}.
+    """
+    rng = random.Random(seed)
+    keys = {User: "users", Character: "characters", Planet: "planets", Vehicle: "vehicles"}
+    written = {}
+    connection = db.session.connection()
+    if connection.dialect.name == "sqlite":
+        # A bigger page cache keeps index maintenance in memory during the load.
+        connection.exec_driver_sql("PRAGMA cache_size = -131072")
+    for model, columns, generate in GENERATORS:
+        count = counts.get(keys[model], 0)
+        if not count:
+            continue
+        start = _max_id(model) + 1
+        rows = generate(rng, start, count)
+        if "changed_at" in model.__table__.columns:
+            # Stamped here like any server write, so the generated data only depends on the seed.
+            changed_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+            columns = columns + ("changed_at",)
+            rows = (row + (changed_at,) for row in rows)
+        with deferred_search_index(connection, model.__tablename__, start), \
+                deferred_version_bump(connection, model.__tablename__):
+            written[model.__tablename__] = write_rows(model.__table__, columns, rows, batch_size)
+
+    if counts.get("favorites"):
+        existing = set()
+        for fk, slot in ((Favorites.planet_fk, 1), (Favorites.vehicle_fk, 2), (Favorites.character_fk, 3)):
+            existing.update((user_id, slot, target_id) for user_id, target_id in
+                            db.session.query(Favorites.user_fk, fk).filter(fk.isnot(None)))
+        rows = favorite_rows(rng, counts["favorites"], _max_id(User), _max_id(Planet), _max_id(Vehicle),
+                             _max_id(Character), skew, existing)
+        written[Favorites.__tablename__] = write_rows(Favorites.__table__, FAVORITE_COLUMNS, rows, batch_size)
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("PRAGMA cache_size = -2000")
+    db.session.commit()
+    if written.get(Favorites.__tablename__):
+        # Favorites were written directly, so the counters are recomputed in bulk.
+        rebuild_counts()
+    return written
@@ -0,0 +1,75 @@
+"""
+Column-driven serializers compiled once per model, and a fast JSON provider
+"""
+import json
+import uuid
+import decimal
+from datetime import date, datetime, time
+from functools import lru_cache
+from operator import attrgetter
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+@lru_cache(maxsize=None)
+def column_names(model):
+    # Mapper attribute keys in table order, e.g. ("id", "name", "url", ...)
+    return tuple(column.key for column in model.__mapper__.column_attrs)
+
+@lru_cache(maxsize=None)
+def row_serializer(names):
+    # For row tuples from query.with_entities(...): no ORM object is built.
+    def serialize(row):
+        return dict(zip(names, row))
+    return serialize
+
+@lru_cache(maxsize=None)
+def entity_serializer(model):
+    names = column_names(model)
+    getter = attrgetter(*names)
+
+    def serialize(obj):
+        return dict(zip(names, getter(obj)))
+    return serialize
+
+class Serializable:
+    """Mixin giving models a serialize() generated from their columns."""
+
+    def serialize(self):
+        return entity_serializer(type(self))(self)
+
+def _default(obj):
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+
+class FastJSONProvider(JSONProvider):
+    """JSON provider using orjson when installed and the stdlib otherwise.
+
+    Datetimes are always encoded as ISO-8601 strings, whichever backend is active.
+    """
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj).decode()
+
+    def dumps_bytes(self, obj):
+        if orjson is not None:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
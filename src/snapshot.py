@@ -0,0 +1,228 @@
+"""
+Versioned, memory-mapped snapshots of the catalog shared by all gunicorn workers
+
+With CATALOG_SNAPSHOT=1, each of Character, Planet and Vehicle is serialized once
+per table version into CATALOG_SNAPSHOT_DIR/<table>-<version hash>.snap:
+
+    header   magic, row count
+    ids      int64[count], ascending
+    edited   int64[count], microseconds since the epoch (-1 for NULL)
+    offsets  uint64[count + 1] into the data section
+    data     the JSON of every row, back to back
+
+Workers mmap the file, and the OS page cache keeps one copy for all of them.
+Plain JSON list pages (only ?limit / ?after) and detail reads without ?fields
+are answered by slicing that map. Lookups bisect the id array, so no query runs
+and no dict is built. The table version is the same table_versions row behind
+the list ETags. List routes already read it on every request. Detail routes
+re-check it at most every CATALOG_SNAPSHOT_CHECK_INTERVAL seconds, and at once
+after this process commits a change to the table. The first worker to see a new
+version writes the file (under a lock). The others fall back to the database
+until it exists.
+"""
+import os
+import mmap
+import time
+import struct
+import hashlib
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from flask import current_app, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import Character, Planet, Vehicle
+from conditional import table_version, entity_validators, is_not_modified, not_modified_response, with_validators
+from serializers import column_names, row_serializer
+from utils import STREAM_BATCH_SIZE, parse_limit, parse_int_arg, wants_stream
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; builds are then not serialized between processes
+    fcntl = None
+
+SNAPSHOT_ENABLED = os.getenv("CATALOG_SNAPSHOT", "0") == "1"
+SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "catalog-snapshot"))
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("CATALOG_SNAPSHOT_CHECK_INTERVAL", 1))
+SNAPSHOT_MODELS = (Character, Planet, Vehicle)
+PAGE_ARGS = {"limit", "after"}
+
+HEADER = struct.Struct("<8sQ")
+MAGIC = b"SWSNAP01"
+EPOCH = datetime(1970, 1, 1)
+NULL_EDITED = -1
+
+class Snapshot:
+    def __init__(self, path):
+        with open(path, "rb") as source:
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError("%s no es un snapshot" % path)
+        view = memoryview(self._map)
+        start = HEADER.size
+        self.ids = view[start:start + 8 * count].cast("q")
+        start += 8 * count
+        self.edited = view[start:start + 8 * count].cast("q")
+        start += 8 * count
+        self.offsets = view[start:start + 8 * (count + 1)].cast("Q")
+        self.data = view[start + 8 * (count + 1):]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]]
+
+    def find(self, entity_id):
+        index = bisect_left(self.ids, entity_id)
+        if index < len(self.ids) and self.ids[index] == entity_id:
+            return index
+        return None
+
+    def edited_at(self, index):
+        value = self.edited[index]
+        return None if value == NULL_EDITED else EPOCH + timedelta(microseconds=value)
+
+    def page(self, after, limit):
+        # Same contract as utils.keyset_paginate: rows with id > after, and the last
+        # id of the page as `next` when more rows follow.
+        start = bisect_right(self.ids, after)
+        end = min(start + limit, len(self.ids))
+        next_cursor = self.ids[end - 1] if end < len(self.ids) else None
+        return [self.row(index) for index in range(start, end)], next_cursor
+
+def _version_hash(model, version):
+    number, changed_at = version
+    parts = (model.__tablename__, number, changed_at.isoformat() if changed_at else "")
+    return hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()[:16]
+
+def _path(model, version):
+    return os.path.join(SNAPSHOT_DIR, "%s-%s.snap" % (model.__tablename__, _version_hash(model, version)))
+
+def write_snapshot(model, path):
+    names = column_names(model)
+    serialize = row_serializer(names)
+    dumps = current_app.json.dumps_bytes
+    edited_position = names.index("edited")
+    query = model.query.with_entities(*(getattr(model, name) for name in names)).order_by(model.id)
+    ids, edited, offsets, chunks = array("q"), array("q"), array("Q", [0]), []
+    for row in query.yield_per(STREAM_BATCH_SIZE):
+        chunk = dumps(serialize(row))
+        ids.append(row.id)
+        value = row[edited_position]
+        edited.append(NULL_EDITED if value is None else (value - EPOCH) // timedelta(microseconds=1))
+        offsets.append(offsets[-1] + len(chunk))
+        chunks.append(chunk)
+    temporary = "%s.%d.tmp" % (path, os.getpid())
+    with open(temporary, "wb") as target:
+        target.write(HEADER.pack(MAGIC, len(ids)))
+        target.write(ids.tobytes())
+        target.write(edited.tobytes())
+        target.write(offsets.tobytes())
+        target.writelines(chunks)
+    os.replace(temporary, path)
+
+def _build(model, version, path):
+    # Returns False when another worker holds the lock; the caller uses the database.
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(os.path.join(SNAPSHOT_DIR, "%s.lock" % model.__tablename__), "w") as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        if not os.path.exists(path):
+            write_snapshot(model, path)
+        # Older versions can go: workers that still map them keep their pages.
+        prefix = model.__tablename__ + "-"
+        for name in os.listdir(SNAPSHOT_DIR):
+            if name.startswith(prefix) and name.endswith(".snap") and os.path.join(SNAPSHOT_DIR, name) != path:
+                os.remove(os.path.join(SNAPSHOT_DIR, name))
+    return True
+
+_loaded = {}   # table -> (version, Snapshot)
+_checked = {}  # table -> (monotonic time of the check, version)
+
+def _known_version(model):
+    table = model.__tablename__
+    checked = _checked.get(table)
+    now = time.monotonic()
+    if checked is None or now - checked[0] > SNAPSHOT_CHECK_INTERVAL:
+        checked = (now, table_version(model))
+        _checked[table] = checked
+    return checked[1]
+
+def snapshot_for(model, version=None):
+    """The snapshot matching `version` (by default the last known table version),
+    built if needed, or None when snapshots are off or another worker is building."""
+    if not SNAPSHOT_ENABLED or model not in SNAPSHOT_MODELS:
+        return None
+    if version is None:
+        version = _known_version(model)
+    loaded = _loaded.get(model.__tablename__)
+    if loaded is not None and loaded[0] == version:
+        return loaded[1]
+    path = _path(model, version)
+    if not os.path.exists(path) and not _build(model, version, path):
+        return None
+    try:
+        snapshot = Snapshot(path)
+    except FileNotFoundError:
+        # Replaced by an even newer version in the meantime.
+        return None
+    _loaded[model.__tablename__] = (version, snapshot)
+    return snapshot
+
+def _json_response(body, status=200):
+    return Response(body, status=status, mimetype="application/json")
+
+def list_response(model, request, validators):
+    # A page of the list route built from the snapshot, or None to use the database
+    # (which also serves the NDJSON and ?stream=1 representations).
+    if not set(request.args) <= PAGE_ARGS or wants_stream(request):
+        return None
+    snapshot = snapshot_for(model, table_version(model))
+    if snapshot is None:
+        return None
+    rows, next_cursor = snapshot.page(parse_int_arg(request.args, "after", 0), parse_limit(request.args))
+    dumps = current_app.json.dumps_bytes
+    body = b'{"msg":"Ok","result":[' + b",".join(rows) + b'],"next":' + dumps(next_cursor) + b"}\n"
+    return with_validators(_json_response(body), validators)
+
+def detail_response(model, entity_id, request, found_msg, missing_msg):
+    # The detail route built from the snapshot, or None to use the database.
+    if request.args.get("fields"):
+        return None
+    snapshot = snapshot_for(model)
+    if snapshot is None:
+        return None
+    dumps = current_app.json.dumps_bytes
+    index = snapshot.find(entity_id)
+    if index is None:
+        return _json_response(dumps({"msg": missing_msg}) + b"\n", status=404)
+    edited = snapshot.edited_at(index)
+    validators = entity_validators(model, entity_id, edited) if edited else None
+    if is_not_modified(request, validators):
+        return not_modified_response(validators)
+    body = b'{"msg":' + dumps(found_msg) + b',"result":' + snapshot.row(index) + b"}\n"
+    return with_validators(_json_response(body), validators)
+
+# Writes committed by this process force a version check on the next read; other
+# workers notice within CATALOG_SNAPSHOT_CHECK_INTERVAL.
+@event.listens_for(Session, "after_flush")
+def _collect_tables(session, flush_context):
+    tables = session.info.setdefault("snapshot_tables", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SNAPSHOT_MODELS):
+            tables.add(obj.__tablename__)
+
+@event.listens_for(Session, "after_commit")
+def _expire_versions(session):
+    for table in session.info.pop("snapshot_tables", ()):
+        _checked.pop(table, None)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_tables(session):
+    session.info.pop("snapshot_tables", None)
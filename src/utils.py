@@ -1,4 +1,5 @@
-from flask import jsonify, url_for
+from flask import jsonify, url_for, current_app, Response, stream_with_context
+from serializers import column_names, row_serializer
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +16,113 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def parse_int_arg(args, name, default=None, minimum=0):
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise APIException("'%s' debe ser un entero" % name, status_code=400)
+    if value < minimum:
+        raise APIException("'%s' debe ser >= %d" % (name, minimum), status_code=400)
+    return value
+
+def parse_limit(args):
+    # Page size, capped on the server so a page never grows with the table.
+    return min(parse_int_arg(args, "limit", DEFAULT_PAGE_SIZE, minimum=1), MAX_PAGE_SIZE)
+
+def keyset_paginate(query, model, args):
+    # Cursor pagination ordered by primary key: `after` is the last id the client
+    # has seen.
+    limit = parse_limit(args)
+    after = parse_int_arg(args, "after", 0)
+    rows = query.filter(model.id > after).order_by(model.id).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def parse_id_list(args, name="ids"):
+    # "1,5,9" -> [1, 5, 9], keeping the request order and dropping repeats
+    ids = []
+    seen = set()
+    for part in args.get(name, "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            value = int(part)
+        except ValueError:
+            raise APIException("'%s' debe ser una lista de enteros" % name, status_code=400)
+        if value in seen:
+            continue
+        seen.add(value)
+        ids.append(value)
+        # Rejected as soon as it is too long, not after parsing the whole string.
+        if len(ids) > MAX_PAGE_SIZE:
+            raise APIException("'%s' admite como maximo %d ids" % (name, MAX_PAGE_SIZE), status_code=400)
+    return ids
+
+def parse_fields(model, args):
+    # ?fields=name,url -> ["id", "name", "url"]; the id is always returned.
+    value = args.get("fields")
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    allowed = column_names(model)
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise APIException("Campos desconocidos: %s" % ", ".join(unknown), status_code=400, payload={"allowed": allowed})
+    return ["id"] + [field for field in fields if field != "id"]
+
+def select_fields(model, args):
+    # Rows come back as plain tuples of the requested columns (all of them without
+    # ?fields=) and are zipped into dicts, skipping ORM hydration entirely.
+    fields = parse_fields(model, args) or column_names(model)
+    columns = (getattr(model, field) for field in fields)
+    return model.query.with_entities(*columns), row_serializer(tuple(fields))
+
+def project(result, fields):
+    if fields is None:
+        return result
+    return {field: result[field] for field in fields}
+
+STREAM_BATCH_SIZE = 500
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+def response_mimetype(request):
+    # Representation of a list route: NDJSON when the client prefers it, JSON otherwise.
+    return NDJSON_MIMETYPE if request.accept_mimetypes.best == NDJSON_MIMETYPE else "application/json"
+
+def wants_stream(request):
+    if request.args.get("stream") in ("1", "true"):
+        return True
+    return response_mimetype(request) == NDJSON_MIMETYPE
+
+def stream_collection(query, model, request, serialize):
+    # Rows are fetched in server-side batches with yield_per and encoded one by one,
+    # so the full table is never materialized in the worker.
+    mimetype = response_mimetype(request)
+    ndjson = mimetype == NDJSON_MIMETYPE
+    rows = query.order_by(model.id).yield_per(STREAM_BATCH_SIZE)
+    dumps = current_app.json.dumps
+
+    def generate():
+        if ndjson:
+            for row in rows:
+                yield dumps(serialize(row)) + "\n"
+            return
+        yield '{"msg": "Ok", "result": ['
+        separator = ""
+        for row in rows:
+            yield separator + dumps(serialize(row))
+            separator = ","
+        yield "]}"
+
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()